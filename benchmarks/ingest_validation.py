@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+r"""
+Benchmark comparing the per-entity cost of the ways the ingest script can validate entities:
+
+1. `validate`: Calling `jsonschema.validate` for each entity, which is what the ingest script
+   used to do. It checks the schema and builds a validator from it on every call.
+2. `jsonschema`: Validating each entity via a validator compiled from the schema once
+   (i.e. `--validation jsonschema`).
+3. `pydantic`: Validating each entity via the Pydantic `Entity` model
+   (i.e. `--validation pydantic`).
+4. `both`: Doing both of the previous two (i.e. `--validation both`, the default).
+
+The entities are those in the example data files in `tests/data`, repeated until there are
+as many as requested. Unlike the other benchmarks, this one does not need a MongoDB server.
+
+Example:
+    $ python benchmarks/ingest_validation.py \
+        --schema-path bertron_schema.json --entities 20000
+"""
+
+import argparse
+import json
+import os
+import time
+from itertools import cycle, islice
+from typing import Callable, Dict, List
+
+import httpx
+import jsonschema
+
+from ingest_data import EntityValidator
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "data")
+DEFAULT_SCHEMA_PATH = "https://raw.githubusercontent.com/ber-data/bertron-schema/v0.1.0-alpha.12/src/schema/jsonschema/bertron_schema.json"
+
+
+def load_schema(schema_path: str) -> Dict:
+    r"""Returns the schema at the path (or URL)."""
+    if schema_path.startswith(("http://", "https://")):
+        response = httpx.get(schema_path)
+        response.raise_for_status()
+        return response.json()
+    with open(schema_path) as f:
+        return json.load(f)
+
+
+def load_example_entities(num_entities: int) -> List[Dict]:
+    r"""Returns the specified number of entities, repeating the example ones as needed."""
+    examples: List[Dict] = []
+    for filename in sorted(os.listdir(DATA_DIR)):
+        if filename.endswith(".json"):
+            with open(os.path.join(DATA_DIR, filename)) as f:
+                data = json.load(f)
+            examples.extend(data if isinstance(data, list) else [data])
+    return list(islice(cycle(examples), num_entities))
+
+
+def benchmark(
+    name: str, validate: Callable[[Dict], object], entities: List[Dict]
+) -> float:
+    r"""Validates the entities, prints the cost per entity, and returns it (in seconds)."""
+    started_at = time.perf_counter()
+    for entity in entities:
+        validate(entity)
+    seconds_per_entity = (time.perf_counter() - started_at) / len(entities)
+    print(
+        f"{name:>10}: {seconds_per_entity * 1e6:9.1f} µs/entity | "
+        f"{1 / seconds_per_entity:10.0f} entities/s"
+    )
+    return seconds_per_entity
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--schema-path",
+        default=DEFAULT_SCHEMA_PATH,
+        help="Path (or URL) of the JSON Schema to validate entities against",
+    )
+    parser.add_argument(
+        "--entities", type=int, default=10_000, help="Number of entities per method"
+    )
+    args = parser.parse_args()
+
+    schema = load_schema(args.schema_path)
+    entities = load_example_entities(args.entities)
+    print(f"{len(entities)} entities")
+
+    def validate_per_call(entity: Dict) -> None:
+        try:
+            jsonschema.validate(instance=entity, schema=schema)
+        except jsonschema.ValidationError:
+            pass
+
+    baseline = benchmark("validate", validate_per_call, entities)
+    for mode in ("jsonschema", "pydantic", "both"):
+        seconds_per_entity = benchmark(
+            mode, EntityValidator(schema, mode).error, entities
+        )
+        print(f"{'':>10}  {baseline / seconds_per_entity:.1f}x `validate`")
+
+
+if __name__ == "__main__":
+    main()
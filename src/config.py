@@ -29,6 +29,65 @@ class Settings(BaseSettings):
     mongo_password: Optional[str] = None
     mongo_database: str = "bertron"
 
+    # Number of documents to fetch from MongoDB per round trip when streaming
+    # entities to the client (e.g. `GET /bertron` with `Accept: application/x-ndjson`).
+    stream_batch_size: int = 1000
+
+    # Number of seconds for which the API trusts its record that the `entities` collection
+    # exists, before confirming it with the MongoDB server again.
+    collection_registry_ttl_seconds: float = 60.0
+
+    # Whether to send entities read from the database to the client without validating them
+    # against the `Entity` model again (they were validated when they were ingested). This
+    # saves a lot of CPU time on large responses. If a schema version is specified, only
+    # documents ingested using that version of the schema (per their `_metadata`) are
+    # trusted; other documents are still validated.
+    trusted_reads: bool = False
+    trusted_reads_schema_version: Optional[str] = None
+
+    # Number of seconds for which the API reuses the ingest generation (i.e. the version of
+    # the data, which the ingest script updates) it last looked up, before looking it up
+    # again. When this is zero, the API looks up the generation once per request.
+    ingest_generation_ttl_seconds: float = 1.0
+
+    # Maximum number of milliseconds for which MongoDB may run each query that a client
+    # specifies the filter of (e.g. via `POST /bertron/find`), after which the API responds
+    # with an error. Set this to zero to not limit the queries' running time.
+    query_max_time_ms: int = 10_000
+
+    # If specified, the API asks MongoDB how it would run each query that a client specifies
+    # the filter of (via an `explain` command) before running it; and if MongoDB would read
+    # the whole collection (instead of using an index) and the collection contains more than
+    # this number of documents, the API rejects the query. If a time limit (in milliseconds)
+    # is also specified for such queries, the API runs them with that (typically shorter)
+    # time limit instead of rejecting them.
+    query_collscan_max_docs: Optional[int] = None
+    query_collscan_max_time_ms: Optional[int] = None
+
+    # Maximum total size (in bytes) of the serialized `POST /bertron/find` responses that the
+    # API keeps in memory to answer repeated queries with, and the number of seconds for which
+    # it reuses each one. The cache is emptied whenever the ingest generation changes. Set the
+    # size to zero to disable the cache.
+    find_cache_max_bytes: int = 64 * 1024 * 1024
+    find_cache_ttl_seconds: float = 300.0
+
+    # Maximum total size (in bytes) of the vector tiles (`GET /bertron/geo/tiles/...`) that the
+    # API keeps in memory, and the number of seconds for which it reuses each one. The cache
+    # is emptied whenever the ingest generation changes. Set the size to zero to disable it.
+    tile_cache_max_bytes: int = 64 * 1024 * 1024
+    tile_cache_ttl_seconds: float = 3600.0
+
+    # Maximum size (in bytes) of the compressed binary point feed (`GET /bertron/geo/points.bin`)
+    # that the API keeps in memory; the API builds the feed once per ingest generation.
+    # Set the size to zero to build the feed for every request.
+    points_cache_max_bytes: int = 256 * 1024 * 1024
+
+    # Whether to keep an in-memory index of the locations of all entities, which the API uses
+    # to answer geospatial queries (e.g. `GET /bertron/geo/nearby`), fetching only the
+    # resulting entities from MongoDB. The index is rebuilt whenever the ingest generation
+    # changes. This requires the `spatial` extra (i.e. NumPy) to be installed.
+    spatial_index: bool = False
+
 
 # Instantiate a settings object that can be imported into other modules.
 settings = Settings()
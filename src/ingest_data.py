@@ -3,18 +3,46 @@
 import argparse
 import json
 import logging
+import multiprocessing
 import os
 import sys
+from collections import deque
 from datetime import datetime, UTC
-from typing import Dict, Optional
+from multiprocessing.pool import AsyncResult, Pool
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
 from schema.datamodel.bertron_schema_pydantic import Entity
 
-from pymongo import MongoClient, GEOSPHERE
+from pymongo import ASCENDING, GEOSPHERE, MongoClient, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
 from pymongo.database import Database
-from pymongo.errors import ConnectionFailure, PyMongoError
-from jsonschema import validate, ValidationError
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from jsonschema import ValidationError
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
+from pydantic import ValidationError as PydanticValidationError
 import httpx
 
+from lib.compression import (
+    DECOMPRESSION_ERRORS,
+    OPENERS,
+    open_input_file,
+    split_compression_extension,
+)
+from lib.generation import ENTITIES_INGEST_STATE_ID, INGEST_STATE_COLLECTION_NAME
+from lib.geohash import geohash_prefixes
+from lib.json_stream import iter_json_lines, iter_json_values
+
 
 # Set up logging
 logging.basicConfig(
@@ -24,18 +52,191 @@ logging.basicConfig(
 )
 logger = logging.getLogger("bertron-ingest")
 
+# The default number of entities we write to the database per `bulk_write` command.
+DEFAULT_BATCH_SIZE = 1000
+
+# The number of entities we send to a worker process to validate at a time.
+VALIDATION_CHUNK_SIZE = 100
+
+# The number of chunks of entities, per worker process, that can be waiting to be validated
+# (or to be written once validated). This bounds the number of entities we hold in memory.
+PENDING_CHUNKS_PER_WORKER = 2
+
+# The extensions of the input files that contain one entity per line (i.e. NDJSON files).
+# Other input files contain either an array of entities or a single entity.
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+# The extensions of the files we ingest from an input directory: those of JSON and NDJSON
+# files, optionally followed by that of a compression format (e.g. `.json.gz`).
+INPUT_EXTENSIONS = tuple(
+    extension + compression_extension
+    for extension in (".json",) + NDJSON_EXTENSIONS
+    for compression_extension in ("",) + tuple(OPENERS)
+)
+
+# The ways in which we can validate entities: against the JSON Schema, against the
+# (Pydantic) `Entity` model, or against both.
+VALIDATION_MODES = ("both", "jsonschema", "pydantic")
+
+
+class EntityValidator:
+    """
+    Class to validate entities against the JSON Schema and/or the `Entity` model.
+
+    The JSON Schema is checked and compiled into a validator once (instead of once per
+    entity, as `jsonschema.validate` does), and the validator is reused for every entity.
+    """
+
+    def __init__(self, schema: Dict, mode: str = "both"):
+        """Initialize the validator with the schema and the validation mode."""
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode: {mode}")
+        self.mode: str = mode
+        self.schema_validator: Optional[Validator] = None
+        if mode in ("both", "jsonschema"):
+            validator_class = validator_for(schema)
+            validator_class.check_schema(schema)
+            self.schema_validator = validator_class(schema)
+
+    def error(self, data: Any) -> Optional[str]:
+        """Return a description of the problem with the data (or `None` if it is valid)."""
+        if not isinstance(data, dict):
+            return f"The entity is not a JSON object (but a {type(data).__name__})"
+        try:
+            if self.schema_validator is not None:
+                self.schema_validator.validate(data)
+            if self.mode in ("both", "pydantic"):
+                _ = Entity(**data)  # Validate against Pydantic model
+            return None
+        except (ValidationError, PydanticValidationError) as e:
+            return str(e)
+
+
+def read_entities(f: TextIO, filepath: str) -> Iterator[Dict]:
+    """
+    Yield the entities in the file as it is read: one per line of an NDJSON file, or the
+    elements of the array of entities (or the single entity) in any other JSON file.
+    """
+    filepath, _ = split_compression_extension(filepath)
+    if filepath.endswith(NDJSON_EXTENSIONS):
+        return iter_json_lines(f)
+    return iter_json_values(f)
+
+
+# The validator with which a worker process validates entities (see `init_validation_worker`).
+worker_validator: Optional[EntityValidator] = None
+
+
+def init_validation_worker(schema: Dict, mode: str) -> None:
+    """Build the validator with which this worker process validates entities."""
+    global worker_validator
+    worker_validator = EntityValidator(schema, mode)
+
+
+def validate_chunk(entities: List[Dict]) -> List[Optional[str]]:
+    """
+    Validate the entities in a worker process, and return a description of the problem with
+    each of them (or `None` for each valid one), in order.
+    """
+    assert worker_validator is not None, "Worker has not been initialized"
+    return [worker_validator.error(entity) for entity in entities]
+
+
+class BulkEntityWriter:
+    """
+    Class to write entities to the 'entities' collection in batches.
+
+    Each entity is upserted by its `id`, via one `bulk_write` command per batch (instead of
+    one `update_one` command per entity); and the writer counts the entities it inserted,
+    the ones it updated, and the ones it failed to write.
+    """
+
+    def __init__(self, collection: Collection, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Initialize the writer with the collection to write to and the batch size."""
+        self.collection: Collection = collection
+        self.batch_size: int = batch_size
+        self.operations: List[UpdateOne] = []
+        # The `id` of the entity each operation in the batch upserts.
+        self.ids: List[str] = []
+        self.id_set: Set[str] = set()
+        self.stats: Dict[str, int] = {"inserted": 0, "updated": 0, "error": 0}
+
+    def add(self, entity: Dict) -> None:
+        """Add an entity to the current batch, writing the batch if it is full."""
+        # Note: MongoDB may apply the operations of an unordered batch in any order; so if
+        #       the batch already upserts this `id`, we write it first (so the later version
+        #       of the entity is the one that ends up in the database).
+        if entity["id"] in self.id_set:
+            self.flush()
+        self.operations.append(
+            UpdateOne({"id": entity["id"]}, {"$set": entity}, upsert=True)
+        )
+        self.ids.append(entity["id"])
+        self.id_set.add(entity["id"])
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the current batch (if any) to the collection."""
+        if len(self.operations) == 0:
+            return
+        operations, ids = self.operations, self.ids
+        self.operations, self.ids, self.id_set = [], [], set()
+        try:
+            result = self.collection.bulk_write(operations, ordered=False)
+            num_inserted, num_updated, num_errors = (
+                result.upserted_count,
+                result.matched_count,
+                0,
+            )
+        except BulkWriteError as e:
+            # Report which entities could not be written (the others were written anyway).
+            for write_error in e.details.get("writeErrors", []):
+                logger.error(
+                    f"Error writing entity {ids[write_error['index']]}: {write_error.get('errmsg')}"
+                )
+            num_inserted, num_updated, num_errors = (
+                e.details.get("nUpserted", 0),
+                e.details.get("nMatched", 0),
+                len(e.details.get("writeErrors", [])),
+            )
+        except PyMongoError as e:
+            logger.error(f"Error writing batch of {len(operations)} entities: {e}")
+            num_inserted, num_updated, num_errors = 0, 0, len(operations)
+
+        self.stats["inserted"] += num_inserted
+        self.stats["updated"] += num_updated
+        self.stats["error"] += num_errors
+        logger.info(
+            f"Wrote batch of {len(operations)} entities: {num_inserted} inserted, "
+            f"{num_updated} updated, {num_errors} failed"
+        )
+
 
 class BertronMongoDBIngestor:
     """Class to handle ingestion of BERtron data into MongoDB."""
 
-    def __init__(self, mongo_uri: str, db_name: str, schema_path: str):
+    def __init__(
+        self,
+        mongo_uri: str,
+        db_name: str,
+        schema_path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        validation_mode: str = "both",
+    ):
         """Initialize the ingestor with connection and schema details."""
         self.mongo_uri: str = mongo_uri
         self.db_name: str = db_name
         self.schema_path: Optional[str] = schema_path
+        self.batch_size: int = batch_size
+        self.validation_mode: str = validation_mode
+        self.validator: Optional[EntityValidator] = None
         self.client: Optional[MongoClient] = None
         self.db: Optional[Database] = None
         self.schema: Optional[dict] = None
+        self.pool: Optional[Pool] = None
+        self.num_workers: int = 0
+        self.reject_file: Optional[TextIO] = None
 
     def connect(self) -> None:
         """Connect to MongoDB."""
@@ -77,76 +278,135 @@ class BertronMongoDBIngestor:
                     self.schema = json.load(f)
             if not isinstance(self.schema, dict):
                 raise ValueError("Failed to parse schema into a Python dictionary")
+            self.validator = None  # i.e. build a new one from this schema
             return self.schema
         except (FileNotFoundError, json.JSONDecodeError) as e:
             logger.error(f"Failed to load schema: {e}")
             sys.exit(1)
 
-    def validate_data(self, data: Dict) -> bool:
-        """Validate data against the loaded schema."""
+    def start_workers(self, num_workers: int) -> None:
+        """Start the worker processes that validate entities in parallel."""
         assert isinstance(self.schema, dict), "Schema has not been loaded"
-        try:
-            validate(instance=data, schema=self.schema)
-            _ = Entity(**data)  # Validate against Pydantic model
-            return True
-        except ValidationError as e:
-            logger.error(f"Validation error: {e}")
-            return False
-
-    def insert_entity(self, entity: Dict) -> Optional[str]:
-        """Insert an entity into the 'entities' collection."""
+        logger.info(f"Starting {num_workers} validation worker processes")
+        self.num_workers = num_workers
+        self.pool = multiprocessing.Pool(
+            processes=num_workers,
+            initializer=init_validation_worker,
+            initargs=(self.schema, self.validation_mode),
+        )
+
+    def open_reject_file(self, path: str) -> None:
+        """Open the file to which invalid entities are written (one JSON object per line)."""
+        logger.info(f"Writing invalid entities to {path}")
+        self.reject_file = open(path, "w")
+
+    def get_validator(self) -> EntityValidator:
+        """Return the validator for the loaded schema, building it if necessary."""
         assert isinstance(self.schema, dict), "Schema has not been loaded"
-        assert self.db is not None, "Connection to database has not been established"
+        if self.validator is None:
+            self.validator = EntityValidator(self.schema, self.validation_mode)
+        return self.validator
+
+    def validate_entities(
+        self, entities: Iterable[Dict]
+    ) -> Iterator[Tuple[Dict, Optional[str]]]:
+        """
+        Validate the entities (in parallel, if worker processes have been started), and yield
+        each of them along with a description of the problem with it (or `None`), in order.
+        """
+        if self.pool is None:
+            validator = self.get_validator()
+            for entity in entities:
+                yield entity, validator.error(entity)
+            return
+
+        # Note: We submit chunks as we read them (rather than via `imap`, which would read
+        #       all of them up front), but only while few enough chunks are pending; so we
+        #       can write entities while others are validated, without reading ahead of the
+        #       writes by more than a few chunks.
+        max_pending_chunks = PENDING_CHUNKS_PER_WORKER * self.num_workers
+        pool = self.pool
+        pending: Deque[Tuple[List[Dict], AsyncResult]] = deque()
+        chunk: List[Dict] = []
+
+        def submit_chunk() -> None:
+            pending.append((chunk, pool.apply_async(validate_chunk, (chunk,))))
+
+        def drain(max_pending: int) -> Iterator[Tuple[Dict, Optional[str]]]:
+            while len(pending) > max_pending:
+                pending_chunk, result = pending.popleft()
+                yield from zip(pending_chunk, result.get())
+
         try:
-            # Add metadata
-            entity["_metadata"] = {
-                "ingested_at": datetime.now(UTC),
-                "schema_version": self.schema.get("version", "unknown"),
-            }
+            for entity in entities:
+                chunk.append(entity)
+                if len(chunk) == VALIDATION_CHUNK_SIZE:
+                    submit_chunk()
+                    chunk = []
+                    yield from drain(max_pending_chunks - 1)
+        except Exception:
+            # Note: If reading the entities fails partway through (e.g. because the file
+            #       is malformed), we still yield the entities we read before that, as we
+            #       do when validating them without worker processes.
+            if chunk:
+                submit_chunk()
+            yield from drain(0)
+            raise
+        if chunk:
+            submit_chunk()
+        yield from drain(0)
+
+    def reject_entity(self, filepath: str, entity: Dict, error: str) -> None:
+        """Report an invalid entity, writing it to the reject file (if there is one)."""
+        logger.error(f"Validation error: {error}")
+        if self.reject_file is not None:
+            record = {"file": filepath, "error": error, "entity": entity}
+            self.reject_file.write(json.dumps(record, default=str) + "\n")
+
+    def prepare_entity(self, entity: Dict) -> Optional[Dict]:
+        """
+        Add the fields we store along with an entity (e.g. its GeoJSON location) to it, and
+        return it; or return `None` if its coordinates are invalid.
+        """
+        assert isinstance(self.schema, dict), "Schema has not been loaded"
 
-            # convert latitude and longitude to mongoDB GeoJSON format
-            if "coordinates" in entity:
-                coordinates = entity["coordinates"]
-                if (
-                    isinstance(coordinates, dict)
-                    and "latitude" in coordinates
-                    and "longitude" in coordinates
-                ):
-                    entity["geojson"] = {
-                        "type": "Point",
-                        "coordinates": [
-                            coordinates["longitude"],
-                            coordinates["latitude"],
-                        ],
-                    }
-                elif entity["coordinates"] is None:
-                    logger.warning(
-                        f"Coordinates are None for entity: {entity.get('name', entity.get('id', 'unnamed'))}"
-                    )
-                else:
-                    logger.error(
-                        f"Invalid coordinates format for entity: {entity.get('name', entity.get('id', 'unnamed'))}"
-                    )
-                    return None
-
-            # Insert with upsert to handle potential duplicates based on ID
-            result = self.db.entities.update_one(
-                {"id": entity["id"]}, {"$set": entity}, upsert=True
-            )
+        # Add metadata
+        entity["_metadata"] = {
+            "ingested_at": datetime.now(UTC),
+            "schema_version": self.schema.get("version", "unknown"),
+        }
 
-            if result.upserted_id:
-                logger.info(
-                    f"Inserted entity: {entity.get('name', entity.get('id', 'unnamed'))}"
+        # convert latitude and longitude to mongoDB GeoJSON format
+        if "coordinates" in entity:
+            coordinates = entity["coordinates"]
+            if (
+                isinstance(coordinates, dict)
+                and "latitude" in coordinates
+                and "longitude" in coordinates
+            ):
+                entity["geojson"] = {
+                    "type": "Point",
+                    "coordinates": [
+                        coordinates["longitude"],
+                        coordinates["latitude"],
+                    ],
+                }
+                # Store the geohashes of the location at several precisions, so that
+                # queries can find the entities in a grid cell via an exact match.
+                entity["geohash"] = geohash_prefixes(
+                    coordinates["longitude"], coordinates["latitude"]
+                )
+            elif entity["coordinates"] is None:
+                logger.warning(
+                    f"Coordinates are None for entity: {entity.get('name', entity.get('id', 'unnamed'))}"
                 )
-                return str(result.upserted_id)
             else:
-                logger.info(
-                    f"Updated entity: {entity.get('name', entity.get('id', 'unnamed'))}"
+                logger.error(
+                    f"Invalid coordinates format for entity: {entity.get('name', entity.get('id', 'unnamed'))}"
                 )
                 return None
-        except PyMongoError as e:
-            logger.error(f"Error inserting entity: {e}")
-            return None
+
+        return entity
 
     def create_indexes(self) -> None:
         """Create indexes for the 'entities' collection."""
@@ -156,41 +416,137 @@ class BertronMongoDBIngestor:
             self.db.entities.create_index("uri")
             # TODO: enforce unique index on id once ess-dive implements unique ids
             self.db.entities.create_index("id", unique=True)
-            self.db.entities.create_index("ber_data_source")
-            self.db.entities.create_index("data_type")
+            # Note: The API sorts pages of documents by `id`; so these indexes let MongoDB
+            #       read a page of the documents having a given value of these fields in
+            #       order, instead of sorting all of them (or scanning the `id` index).
+            for field in ("ber_data_source", "data_type", "entity_type"):
+                self.db.entities.create_index([(field, ASCENDING), ("id", ASCENDING)])
             self.db.entities.create_index([("geojson", GEOSPHERE)])
+            self.db.entities.create_index("geohash")
+            self.db.entities.create_index("_metadata.ingested_at")
             logger.info("Indexes created successfully")
         except PyMongoError as e:
             logger.error(f"Error creating indexes: {e}")
 
-    def ingest_file(self, filepath: str) -> Dict[str, int]:
-        """Ingest entities from a JSON file."""
-        stats = {"processed": 0, "valid": 0, "invalid": 0, "inserted": 0, "error": 0}
-
+    def backfill_geohashes(self, batch_size: int = 1000) -> int:
+        """
+        Store the geohashes of the locations of the entities that were ingested before the
+        ingest script stored them, and return the number of entities updated.
+        """
+        assert self.db is not None, "Connection to database has not been established"
+        num_updated = 0
+        operations = []
+        cursor = self.db.entities.find(
+            {"geojson.type": "Point", "geohash": {"$exists": False}},
+            projection={"geojson.coordinates": 1},
+            batch_size=batch_size,
+        )
+        for document in cursor:
+            longitude, latitude = document["geojson"]["coordinates"][:2]
+            operations.append(
+                UpdateOne(
+                    {"_id": document["_id"]},
+                    {"$set": {"geohash": geohash_prefixes(longitude, latitude)}},
+                )
+            )
+            if len(operations) == batch_size:
+                num_updated += self.db.entities.bulk_write(operations).modified_count
+                operations = []
+        if len(operations) > 0:
+            num_updated += self.db.entities.bulk_write(operations).modified_count
+        logger.info(f"Backfilled the geohashes of {num_updated} entities")
+        return num_updated
+
+    def record_ingest_generation(self, is_starting: bool = False) -> None:
+        """
+        Start a new ingest generation of the 'entities' collection.
+
+        The API uses the generation to tell whether the data has changed since it
+        built a given response (e.g. to support conditional GET requests).
+
+        We start one before we modify the data (`is_starting`), and another one once we
+        have stopped modifying it (whether or not we succeeded); so the API does not keep
+        serving responses built from the data as it was before (or during) an ingest.
+        """
+        assert self.db is not None, "Connection to database has not been established"
         try:
-            with open(filepath, "r") as f:
-                data = json.load(f)
+            latest_entity = None
+            if not is_starting:
+                latest_entity = self.db.entities.find_one(
+                    {},
+                    projection={"_metadata.ingested_at": 1},
+                    sort=[("_metadata.ingested_at", -1)],
+                )
+            last_ingested_at = (
+                latest_entity["_metadata"]["ingested_at"]
+                if latest_entity is not None
+                else datetime.now(UTC)
+            )
+            # Note: We use `$max` so the time never goes backward (e.g. if an ingest
+            #       stops before writing any entities).
+            result = self.db[INGEST_STATE_COLLECTION_NAME].find_one_and_update(
+                {"_id": ENTITIES_INGEST_STATE_ID},
+                {
+                    "$inc": {"generation": 1},
+                    "$max": {"last_ingested_at": last_ingested_at},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            logger.info(f"Recorded ingest generation {result['generation']}")
+        except PyMongoError as e:
+            logger.error(f"Error recording ingest generation: {e}")
 
-            # Handle both single entity and array of entities
-            entities = data if isinstance(data, list) else [data]
-            stats["processed"] = len(entities)
+    def ingest_file(self, filepath: str) -> Dict[str, int]:
+        """
+        Ingest entities from a JSON (or NDJSON) file, which may be compressed.
 
-            for entity in entities:
-                if self.validate_data(entity):
-                    stats["valid"] += 1
-                    if self.insert_entity(entity):
-                        stats["inserted"] += 1
-                else:
-                    stats["invalid"] += 1
+        The entities flow from the file, through validation, to the database as the file is
+        read (and decompressed); so we hold only a few batches of entities in memory, however
+        big the file is.
+        """
+        assert self.db is not None, "Connection to database has not been established"
+        stats = {"processed": 0, "valid": 0, "invalid": 0, "error": 0}
+        writer = BulkEntityWriter(self.db.entities, batch_size=self.batch_size)
 
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+        try:
+            with open_input_file(filepath) as f:
+                entities = read_entities(f, filepath)
+                for entity, error in self.validate_entities(entities):
+                    stats["processed"] += 1
+                    if error is None:
+                        stats["valid"] += 1
+                        prepared_entity = self.prepare_entity(entity)
+                        if prepared_entity is not None:
+                            writer.add(prepared_entity)
+                        else:
+                            stats["error"] += 1
+                    else:
+                        stats["invalid"] += 1
+                        self.reject_entity(filepath, entity, error)
+
+        except (FileNotFoundError, json.JSONDecodeError, *DECOMPRESSION_ERRORS) as e:
             logger.error(f"Error processing file {filepath}: {e}")
             stats["error"] += 1
-
-        return stats
+        finally:
+            writer.flush()
+
+        return {
+            **stats,
+            "inserted": writer.stats["inserted"],
+            "updated": writer.stats["updated"],
+            "error": stats["error"] + writer.stats["error"],
+        }
 
     def close(self) -> None:
-        """Close the MongoDB connection."""
+        """Close the MongoDB connection, and stop the worker processes (if any)."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.reject_file is not None:
+            self.reject_file.close()
+            self.reject_file = None
         if self.client:
             self.client.close()
             logger.info("MongoDB connection closed")
@@ -213,52 +569,109 @@ def main():
         help="Path or URL to the BERtron schema JSON file",
     )
     parser.add_argument(
-        "--input", required=True, help="Path to the input JSON file or directory"
+        "--input",
+        help="Path to the input JSON (or NDJSON) file, which may be compressed, or directory",
     )
     parser.add_argument(
         "--clean",
         action="store_true",
         help="Delete existing collections before ingesting new data",
     )
+    parser.add_argument(
+        "--backfill-geohash",
+        action="store_true",
+        help="Store the geohashes of already-ingested entities that lack them, and exit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to validate entities with (1 validates them in this process)",
+    )
+    parser.add_argument(
+        "--validation",
+        choices=VALIDATION_MODES,
+        default="both",
+        help="Whether to validate entities against the JSON Schema, the Pydantic model, or both",
+    )
+    parser.add_argument(
+        "--reject-file",
+        help="Path to a file to write invalid entities to, one JSON object per line",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Number of entities to write to MongoDB per bulk write",
+    )
 
     args = parser.parse_args()
+    if args.input is None and not args.backfill_geohash:
+        parser.error("the following arguments are required: --input")
 
     ingestor = BertronMongoDBIngestor(
-        mongo_uri=args.mongo_uri, db_name=args.db_name, schema_path=args.schema_path
+        mongo_uri=args.mongo_uri,
+        db_name=args.db_name,
+        schema_path=args.schema_path,
+        batch_size=args.batch_size,
+        validation_mode=args.validation,
     )
 
     try:
         ingestor.connect()
-        ingestor.load_schema()
 
-        # Clean collections if requested
-        if args.clean:
-            logger.info("Clean flag enabled - removing existing collections")
-            ingestor.clean_collections()
-
-        total_stats = {
-            "processed": 0,
-            "valid": 0,
-            "invalid": 0,
-            "inserted": 0,
-            "error": 0,
-        }
+        if args.backfill_geohash:
+            ingestor.create_indexes()
+            # Let the API know that the data is changing (since queries can filter on the
+            # geohashes), as we do when ingesting data.
+            ingestor.record_ingest_generation(is_starting=True)
+            try:
+                ingestor.backfill_geohashes()
+            finally:
+                ingestor.record_ingest_generation()
+            return
+
+        ingestor.load_schema()
+        if args.workers > 1:
+            ingestor.start_workers(args.workers)
+        if args.reject_file is not None:
+            ingestor.open_reject_file(args.reject_file)
+
+        # Let the API know that the data is changing, before we change it and again once
+        # we are done (even if we fail partway through)
+        ingestor.record_ingest_generation(is_starting=True)
+        try:
+            # Clean collections if requested
+            if args.clean:
+                logger.info("Clean flag enabled - removing existing collections")
+                ingestor.clean_collections()
+
+            total_stats = {
+                "processed": 0,
+                "valid": 0,
+                "invalid": 0,
+                "inserted": 0,
+                "updated": 0,
+                "error": 0,
+            }
 
-        ingestor.create_indexes()  # Create indexes before ingesting data
-
-        # Process a single file or all JSON files in a directory
-        if os.path.isdir(args.input):
-            for filename in os.listdir(args.input):
-                if filename.endswith(".json"):
-                    file_path = os.path.join(args.input, filename)
-                    logger.info(f"Processing file: {file_path}")
-                    stats = ingestor.ingest_file(file_path)
-                    for key in total_stats:
-                        total_stats[key] += stats[key]
-        else:
-            # Process a single file
-            logger.info(f"Processing file: {args.input}")
-            total_stats = ingestor.ingest_file(args.input)
+            ingestor.create_indexes()  # Create indexes before ingesting data
+
+            # Process a single file or all JSON files in a directory
+            if os.path.isdir(args.input):
+                for filename in os.listdir(args.input):
+                    if filename.endswith(INPUT_EXTENSIONS):
+                        file_path = os.path.join(args.input, filename)
+                        logger.info(f"Processing file: {file_path}")
+                        stats = ingestor.ingest_file(file_path)
+                        for key in total_stats:
+                            total_stats[key] += stats[key]
+            else:
+                # Process a single file
+                logger.info(f"Processing file: {args.input}")
+                total_stats = ingestor.ingest_file(args.input)
+        finally:
+            ingestor.record_ingest_generation()
 
         # Report results
         logger.info("Ingestion completed")
@@ -266,6 +679,7 @@ def main():
         logger.info(f"Valid entities: {total_stats['valid']}")
         logger.info(f"Invalid entities: {total_stats['invalid']}")
         logger.info(f"Inserted entities: {total_stats['inserted']}")
+        logger.info(f"Updated entities: {total_stats['updated']}")
         logger.info(f"Errors: {total_stats['error']}")
 
     finally:
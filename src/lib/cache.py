@@ -0,0 +1,164 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Query operators whose operand is a list of filters.
+LOGICAL_OPERATORS = ["$and", "$or", "$nor"]
+
+
+def canonical_filter(filter: Dict[str, Any]) -> Dict[str, Any]:
+    r"""
+    Returns a copy of the MongoDB filter in which the keys whose order does not affect the
+    meaning of the filter (i.e. field names and query operators) are sorted, so equivalent
+    filters written in different ways have the same canonical form.
+
+    Note: The keys of embedded documents the filter compares fields to are _not_ sorted,
+          since MongoDB takes their order into account when comparing documents.
+
+    >>> canonical_filter({"name": "a", "coordinates.latitude": {"$lt": 50, "$gt": 40}})
+    {'coordinates.latitude': {'$gt': 40, '$lt': 50}, 'name': 'a'}
+    >>> canonical_filter({"$or": [{"b": 1, "a": 1}], "c": {"y": 1, "x": 1}})
+    {'$or': [{'a': 1, 'b': 1}], 'c': {'y': 1, 'x': 1}}
+    """
+    canonical = {}
+    for key in sorted(filter):
+        value = filter[key]
+        if key in LOGICAL_OPERATORS and isinstance(value, list):
+            value = [canonical_filter(f) if isinstance(f, dict) else f for f in value]
+        elif isinstance(value, dict) and all(k.startswith("$") for k in value):
+            value = {operator: value[operator] for operator in sorted(value)}
+        canonical[key] = value
+    return canonical
+
+
+def canonical_key(
+    filter: Dict[str, Any],
+    projection: Optional[Dict[str, Any]],
+    sort: Optional[Dict[str, int]],
+    *options: Any,
+) -> str:
+    r"""
+    Returns a string that identifies a query, which is the same for equivalent queries.
+
+    Note: The order of the sort keys is preserved, since it determines the order of the results.
+
+    >>> canonical_key({"b": 1, "a": 1}, {"y": 1, "x": 1}, None, 10) == canonical_key(
+    ...     {"a": 1, "b": 1}, {"x": 1, "y": 1}, None, 10
+    ... )
+    True
+    >>> canonical_key({}, None, {"a": 1, "b": 1}) == canonical_key({}, None, {"b": 1, "a": 1})
+    False
+    """
+    return json.dumps(
+        [
+            canonical_filter(filter),
+            None if projection is None else dict(sorted(projection.items())),
+            None if sort is None else list(sort.items()),
+            *options,
+        ],
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+class ResponseCache:
+    r"""
+    An in-memory, least-recently-used cache of serialized responses.
+
+    The cache holds up to `max_bytes` bytes of responses, evicting the least recently used
+    ones to make room for new ones; and it reuses each response for up to `ttl_seconds`
+    seconds. Each response is cached for a specific version of the data (e.g. an ingest
+    generation), and the cache discards all of its responses when that version changes.
+
+    >>> cache = ResponseCache(max_bytes=10, ttl_seconds=60)
+    >>> cache.put("a", 1, b"12345")
+    >>> cache.put("b", 1, b"12345")
+    >>> cache.get("a", 1)
+    b'12345'
+    >>> cache.put("c", 1, b"123")  # evicts "b", the least recently used response
+    >>> cache.get("b", 1) is None, cache.get("c", 1)
+    (True, b'123')
+    >>> cache.get("a", 2) is None  # a new version of the data
+    True
+    >>> cache.put("a", 1, b"12345")  # a response for the previous version of the data
+    >>> cache.get("a", 2) is None
+    True
+    >>> cache.stats()
+    {'hits': 2, 'misses': 3, 'entries': 0, 'size_bytes': 0, 'max_bytes': 10, 'evictions': 1, 'invalidations': 1}
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Maps each key to the response and when it was cached, least recently used first.
+        self._entries: OrderedDict[str, Tuple[bytes, float]] = OrderedDict()
+        self._size_bytes = 0
+        self._version: Optional[Hashable] = None
+
+    def get(self, key: str, version: Hashable) -> Optional[bytes]:
+        r"""Returns the response cached for the key and version of the data, if any."""
+        self._check_version(version)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] >= self.ttl_seconds:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, version: Hashable, content: bytes) -> None:
+        r"""
+        Caches the response for the key and version of the data, if it fits in the cache.
+
+        Note: The response is not cached if the cache has since moved on to another version
+              of the data (e.g. because an ingest started while the response was prepared);
+              since that version may well be newer than the one the response is for.
+        """
+        if self._version is None:
+            self._version = version
+        if version != self._version or len(content) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        while self._size_bytes + len(content) > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = (content, time.monotonic())
+        self._size_bytes += len(content)
+
+    def clear(self) -> None:
+        r"""Discards all cached responses."""
+        self._entries.clear()
+        self._size_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        r"""Returns the cache's counters and its current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _check_version(self, version: Hashable) -> None:
+        r"""Discards all cached responses if they are for another version of the data."""
+        if version != self._version:
+            if len(self._entries) > 0:
+                self.invalidations += 1
+            self.clear()
+            self._version = version
+
+    def _remove(self, key: str) -> None:
+        content, _ = self._entries.pop(key)
+        self._size_bytes -= len(content)
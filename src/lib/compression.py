@@ -0,0 +1,174 @@
+r"""
+Reads (possibly) compressed input files, decompressing them on the fly, so that the ingest
+script can ingest the compressed dumps it receives without first decompressing them to disk.
+
+A compressed file is decompressed in a separate thread, which stays a few chunks ahead of
+the thread parsing the decompressed data; since the decompressors release the GIL while they
+work, decompressing can overlap with parsing.
+
+Note: The `zstandard` package is an optional dependency (see the `zstd` extra in
+      `pyproject.toml`), which is only needed to read `.zst` files.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+from typing import BinaryIO, Callable, Dict, Optional, TextIO, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+# The number of (decompressed) bytes the decompressing thread reads at a time, and the
+# number of such chunks it can read ahead of the parsing thread.
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_MAX_PENDING_CHUNKS = 4
+
+
+class MissingDecompressorError(Exception):
+    r"""
+    An error raised upon opening a file compressed in a format that we cannot decompress,
+    since the optional dependency needed to do so is not installed.
+    """
+
+
+def open_zstd(path: str) -> BinaryIO:
+    r"""Opens the Zstandard-compressed file for reading its decompressed bytes."""
+    if zstandard is None:
+        raise MissingDecompressorError(
+            f"Cannot read {path}: reading .zst files requires the `zstandard` package "
+            f"(see the `zstd` extra)"
+        )
+    return zstandard.open(path, "rb")
+
+
+# The functions that open files compressed in each format, for reading their decompressed
+# bytes, by file extension.
+OPENERS: Dict[str, Callable[[str], BinaryIO]] = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".zst": open_zstd,
+}
+
+# The exceptions that reading a corrupt (or truncated) compressed file, or one we cannot
+# decompress, can raise.
+# Note: `gzip` and `bz2` raise `OSError`s; and they, like `lzma`, raise an `EOFError` upon
+#       reaching the end of a truncated file.
+DECOMPRESSION_ERRORS: Tuple[type, ...] = (
+    OSError,
+    EOFError,
+    lzma.LZMAError,
+    MissingDecompressorError,
+) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def split_compression_extension(path: str) -> Tuple[str, Optional[str]]:
+    r"""
+    Returns the path without the extension of the compression format of the file (if any),
+    and that extension (or `None` if the file is not compressed).
+
+    >>> split_compression_extension("dumps/nmdc.jsonl.zst")
+    ('dumps/nmdc.jsonl', '.zst')
+    >>> split_compression_extension("dumps/nmdc.json")
+    ('dumps/nmdc.json', None)
+    """
+    for extension in OPENERS:
+        if path.endswith(extension):
+            return path[: -len(extension)], extension
+    return path, None
+
+
+class ThreadedReader(io.RawIOBase):
+    r"""
+    A readable binary stream that reads another one in a separate thread, which stays (up
+    to) a few chunks ahead of the reads from this stream.
+
+    >>> reader = ThreadedReader(io.BytesIO(b"abcdefg"), chunk_size=3)
+    >>> reader.read(2), reader.read(), reader.read()
+    (b'ab', b'cdefg', b'')
+    >>> reader.close()
+    """
+
+    def __init__(
+        self,
+        f: BinaryIO,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_pending_chunks: int = DEFAULT_MAX_PENDING_CHUNKS,
+    ):
+        super().__init__()
+        self.f = f
+        self.chunk_size = chunk_size
+        # Note: The queue contains chunks of bytes, followed by either an empty chunk (at
+        #       the end of the stream) or the exception that reading the stream raised.
+        self.chunks: "queue.Queue[Union[bytes, BaseException]]" = queue.Queue(
+            maxsize=max_pending_chunks
+        )
+        self.chunk = memoryview(b"")  # the unread part of the current chunk
+        self.at_end = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.read_chunks, daemon=True)
+        self.thread.start()
+
+    def read_chunks(self) -> None:
+        r"""Reads the chunks of the other stream into the queue (in the separate thread)."""
+        try:
+            while not self.stopping.is_set():
+                chunk = self.f.read(self.chunk_size)
+                self.chunks.put(chunk)
+                if not chunk:
+                    break
+        except BaseException as e:
+            self.chunks.put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.chunk and not self.at_end:
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                self.at_end = True
+                raise chunk
+            self.chunk = memoryview(chunk)
+            self.at_end = not chunk
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            # Stop the thread, taking chunks off the queue so it is not blocked adding one.
+            self.stopping.set()
+            while self.thread.is_alive():
+                try:
+                    self.chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.f.close()
+        super().close()
+
+
+def open_input_file(path: str) -> TextIO:
+    r"""
+    Opens the (UTF-8 encoded) file for reading its text; decompressing it, in a separate
+    thread, if its extension is that of a compression format.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "entities.json.gz")
+    >>> with gzip.open(path, "wt") as f:
+    ...     _ = f.write('[{"id": "a"}]')
+    >>> with open_input_file(path) as f:
+    ...     f.read()
+    '[{"id": "a"}]'
+    """
+    _, extension = split_compression_extension(path)
+    if extension is None:
+        return open(path, "r", encoding="utf-8")
+    reader = ThreadedReader(OPENERS[extension](path))
+    return io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8")
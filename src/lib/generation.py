@@ -0,0 +1,101 @@
+import hashlib
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+# The name of the collection in which the ingest script records the ingest generation of
+# each collection it writes to, and the `_id` of the document about the entities collection.
+INGEST_STATE_COLLECTION_NAME = "ingest_state"
+ENTITIES_INGEST_STATE_ID = "entities"
+
+
+@dataclass(frozen=True)
+class IngestGeneration:
+    r"""
+    Identifies a version of the data in the entities collection. The ingest script starts a
+    new generation each time it runs, so responses built from the same generation are the same.
+    """
+
+    number: int
+    last_ingested_at: datetime
+
+    @property
+    def last_modified(self) -> datetime:
+        r"""
+        The (timezone-aware) time at which the data was last modified.
+
+        Note: PyMongo returns naive `datetime`s, which represent UTC times.
+
+        >>> IngestGeneration(1, datetime(2025, 1, 2, 3, 4, 5)).last_modified.isoformat()
+        '2025-01-02T03:04:05+00:00'
+        """
+        if self.last_ingested_at.tzinfo is None:
+            return self.last_ingested_at.replace(tzinfo=timezone.utc)
+        return self.last_ingested_at
+
+    @property
+    def http_last_modified(self) -> str:
+        r"""
+        The time at which the data was last modified, formatted for a `Last-Modified` header.
+
+        >>> IngestGeneration(1, datetime(2025, 1, 2, 3, 4, 5)).http_last_modified
+        'Thu, 02 Jan 2025 03:04:05 GMT'
+        """
+        return format_datetime(self.last_modified, usegmt=True)
+
+    def etag(self, *representation: Optional[str]) -> str:
+        r"""
+        Returns a strong entity tag for the representation of a resource built from this
+        generation of the data. The caller specifies whatever (besides the data) determines
+        the representation; e.g. the URL and the `Accept` header of the request.
+
+        >>> generation = IngestGeneration(1, datetime(2025, 1, 2, 3, 4, 5))
+        >>> generation.etag("/bertron") == generation.etag("/bertron")
+        True
+        >>> generation.etag("/bertron") == generation.etag("/bertron?stream=true")
+        False
+        >>> generation.etag("/bertron") == IngestGeneration(2, datetime(2025, 1, 2, 3, 4, 5)).etag("/bertron")
+        False
+        """
+        hasher = hashlib.sha256()
+        hasher.update(f"{self.number}\0{self.last_modified.isoformat()}".encode())
+        for part in representation:
+            hasher.update(b"\0" + (part or "").encode())
+        return f'"{hasher.hexdigest()[:32]}"'
+
+
+class IngestGenerationTracker:
+    r"""
+    Keeps track of the current ingest generation of the entities collection.
+
+    Looking up the generation is a single `find_one` by `_id` on a tiny collection. When
+    the TTL is greater than zero, a generation that was looked up within the last TTL
+    seconds is reused without asking the MongoDB server at all.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        # Maps each database name to the generation looked up and when it was looked up.
+        self._cache: Dict[str, Tuple[Optional[IngestGeneration], float]] = {}
+
+    async def get(self, db: AsyncDatabase) -> Optional[IngestGeneration]:
+        r"""Returns the current generation, or `None` if the ingest script has not recorded one."""
+        cached = self._cache.get(db.name)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl_seconds:
+            return cached[0]
+
+        state = await db[INGEST_STATE_COLLECTION_NAME].find_one(
+            {"_id": ENTITIES_INGEST_STATE_ID}
+        )
+        generation = None
+        if state is not None:
+            generation = IngestGeneration(
+                number=state["generation"],
+                last_ingested_at=state["last_ingested_at"],
+            )
+        self._cache[db.name] = (generation, time.monotonic())
+        return generation
@@ -0,0 +1,153 @@
+import math
+from typing import Any, Dict, Tuple
+
+# A bounding box, as `(west, south, east, north)` in degrees of longitude and latitude.
+BoundingBox = Tuple[float, float, float, float]
+
+# The number of grid cells (per axis) into which we divide each map tile when clustering
+# points; i.e. at zoom level `z`, the world is `2^z * CELLS_PER_TILE` cells wide.
+# Note: Map tiles are typically 256 pixels wide, so each cell is about 64 pixels wide.
+CELLS_PER_TILE = 4
+
+# The highest zoom level that web maps (e.g. Leaflet's) typically support.
+MAX_ZOOM = 22
+
+# The maximum width (in degrees of longitude) of the polygons we use to query bounding boxes.
+# Note: MongoDB considers the interior of a polygon to be the smaller of the two areas its
+#       boundary divides the globe into; so we query wider bounding boxes via several
+#       polygons, each of which is smaller than a hemisphere.
+MAX_POLYGON_WIDTH = 90.0
+
+# The maximum absolute latitude of the vertices of the polygons we use to query bounding
+# boxes. A bounding box's edge at a pole would have duplicate vertices (since all points at
+# a pole are the same point), which MongoDB rejects; so we stop just short of the poles.
+MAX_POLYGON_LATITUDE = 89.9999
+
+
+def parse_bbox(value: str) -> BoundingBox:
+    r"""
+    Parses a bounding box specified as `"west,south,east,north"`, which is the format
+    in which Leaflet's `LatLngBounds.toBBoxString` and many tile servers express them.
+    A bounding box whose west longitude is greater than its east longitude crosses the
+    antimeridian (i.e. 180 degrees longitude).
+
+    Raises a `ValueError` if the bounding box is malformed or out of range.
+
+    >>> parse_bbox("-122.4,47.5,-122.2,47.7")
+    (-122.4, 47.5, -122.2, 47.7)
+    >>> parse_bbox("1,2,3")
+    Traceback (most recent call last):
+    ...
+    ValueError: The bounding box must consist of four numbers: west,south,east,north
+    >>> parse_bbox("170,-20,-170,-10")
+    (170.0, -20.0, -170.0, -10.0)
+    >>> parse_bbox("-122.2,47.5,-122.2,47.7")
+    Traceback (most recent call last):
+    ...
+    ValueError: The west longitude must differ from the east longitude
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError(
+            "The bounding box must consist of four numbers: west,south,east,north"
+        )
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("Longitudes must be between -180 and 180")
+    if not (-90 <= south <= 90 and -90 <= north <= 90):
+        raise ValueError("Latitudes must be between -90 and 90")
+    if west == east:
+        raise ValueError("The west longitude must differ from the east longitude")
+    if south >= north:
+        raise ValueError("The south latitude must be less than the north latitude")
+    return west, south, east, north
+
+
+def grid_cell_size(zoom: int) -> float:
+    r"""
+    Returns the width and height (in degrees) of the grid cells into which we group points
+    at the specified zoom level, so that each cell covers a similar area of the screen
+    at every zoom level.
+
+    >>> grid_cell_size(0)
+    90.0
+    >>> grid_cell_size(3)
+    11.25
+    """
+    return 360 / (2**zoom * CELLS_PER_TILE)
+
+
+def bbox_polygon(bbox: BoundingBox, max_edge_degrees: float = 1.0) -> Dict[str, Any]:
+    r"""
+    Returns a GeoJSON polygon covering the bounding box, for use in `$geoWithin` queries
+    (which can use a 2dsphere index, unlike `$box` queries).
+
+    On a sphere, a polygon's edges are great circle arcs; whereas a bounding box's southern
+    and northern edges are parallels (i.e. lines of constant latitude). So, we approximate each
+    of those edges with several short edges, which deviate from the parallel much less than a
+    single long edge would.
+
+    >>> bbox_polygon((0, 10, 2, 20))["coordinates"]
+    [[[0.0, 10], [1.0, 10], [2.0, 10], [2.0, 20], [1.0, 20], [0.0, 20], [0.0, 10]]]
+    """
+    west, south, east, north = bbox
+    num_edges = max(1, math.ceil((east - west) / max_edge_degrees))
+    longitudes = [west + (east - west) * i / num_edges for i in range(num_edges + 1)]
+    ring = (
+        [[longitude, south] for longitude in longitudes]
+        + [[longitude, north] for longitude in reversed(longitudes)]
+        + [[longitudes[0], south]]
+    )
+    return {"type": "Polygon", "coordinates": [ring]}
+
+
+def bbox_filter(bbox: BoundingBox, field: str = "geojson") -> Dict[str, Any]:
+    r"""
+    Returns a MongoDB filter matching the documents whose GeoJSON `field` is located within
+    the bounding box, which MongoDB can evaluate via a 2dsphere index on that field.
+
+    A bounding box that crosses the antimeridian (i.e. whose west longitude is greater than
+    its east longitude) is split there; and wide bounding boxes are split into several
+    polygons, which are each narrower than `MAX_POLYGON_WIDTH`.
+
+    >>> [len(c["geojson"]["$geoWithin"]["$geometry"]["coordinates"][0])
+    ...  for c in bbox_filter((170, -20, -170, -10))["$or"]]
+    [23, 23]
+    >>> len(bbox_filter((-180, -90, 180, 90))["$or"])
+    4
+    >>> polygon = bbox_filter((180, 0, -170, 10))["geojson"]["$geoWithin"]["$geometry"]
+    >>> polygon["coordinates"][0][:3]
+    [[-180.0, 0], [-179.0, 0], [-178.0, 0]]
+    >>> bbox_filter((180, 0, -180, 10))
+    {'geojson': {'$in': []}}
+    """
+    west, south, east, north = bbox
+    south = max(south, -MAX_POLYGON_LATITUDE)
+    north = min(north, MAX_POLYGON_LATITUDE)
+    spans = [(west, 180.0), (-180.0, east)] if west > east else [(west, east)]
+
+    # Note: A bounding box that "crosses" the antimeridian at one of its edges (e.g. one
+    #       whose west longitude is 180) has a span of zero width there, whose polygon
+    #       MongoDB would reject (since its vertices would repeat); so we omit such spans.
+    spans = [
+        (span_west, span_east)
+        for span_west, span_east in spans
+        if span_west != span_east
+    ]
+    if len(spans) == 0:
+        return {field: {"$in": []}}  # i.e. match nothing, since the box has no width
+
+    polygons = []
+    for span_west, span_east in spans:
+        num_parts = max(1, math.ceil((span_east - span_west) / MAX_POLYGON_WIDTH))
+        part_width = (span_east - span_west) / num_parts
+        for i in range(num_parts):
+            part_west = span_west + i * part_width
+            part_east = span_east if i == num_parts - 1 else part_west + part_width
+            polygons.append(bbox_polygon((part_west, south, part_east, north)))
+
+    if len(polygons) == 1:
+        return {field: {"$geoWithin": {"$geometry": polygons[0]}}}
+    return {
+        "$or": [{field: {"$geoWithin": {"$geometry": polygon}}} for polygon in polygons]
+    }
@@ -0,0 +1,68 @@
+r"""
+Geohashes, which identify the cells of a hierarchical grid covering the globe.
+
+A geohash of `n` characters identifies a cell, and appending a character to it identifies
+one of the 32 cells into which that cell is divided; so the geohashes of a point at lower
+precisions are the prefixes of its geohash at the highest precision. The ingest script
+stores the geohashes of each entity's location at several precisions, so that queries can
+find (or group) the entities in a cell by matching those geohashes exactly.
+
+Reference: https://en.wikipedia.org/wiki/Geohash
+"""
+
+from typing import List
+
+# The characters with which geohashes are written (each one representing 5 bits).
+BASE32_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# The precisions (i.e. numbers of characters) of the geohashes we store for each entity.
+# Note: A cell of a geohash having 1 character is about 5000 km wide, and a cell of one
+#       having 8 characters is about 40 m wide.
+GEOHASH_PRECISIONS = range(1, 9)
+
+
+def encode_geohash(longitude: float, latitude: float, precision: int) -> str:
+    r"""
+    Returns the geohash, having the specified number of characters, of the cell that
+    contains the point.
+
+    >>> encode_geohash(-5.6, 42.6, 5)
+    'ezs42'
+    >>> encode_geohash(-118.2437, 34.0522, 6)  # Los Angeles
+    '9q5ctr'
+    >>> encode_geohash(180.0, 90.0, 2)
+    'zz'
+    """
+    west, east = -180.0, 180.0
+    south, north = -90.0, 90.0
+    characters = []
+    bits, num_bits = 0, 0
+    is_longitude_bit = True  # i.e. the bits alternate, starting with a longitude bit
+    while len(characters) < precision:
+        if is_longitude_bit:
+            middle = (west + east) / 2
+            bit = int(longitude >= middle)
+            west, east = (middle, east) if bit else (west, middle)
+        else:
+            middle = (south + north) / 2
+            bit = int(latitude >= middle)
+            south, north = (middle, north) if bit else (south, middle)
+        bits = bits << 1 | bit
+        num_bits += 1
+        is_longitude_bit = not is_longitude_bit
+        if num_bits == 5:
+            characters.append(BASE32_ALPHABET[bits])
+            bits, num_bits = 0, 0
+    return "".join(characters)
+
+
+def geohash_prefixes(longitude: float, latitude: float) -> List[str]:
+    r"""
+    Returns the geohashes of the point at each of the `GEOHASH_PRECISIONS`, from the least
+    precise to the most precise.
+
+    >>> geohash_prefixes(118.0, 34.0)
+    ['w', 'ww', 'ww5', 'ww5c', 'ww5cm', 'ww5cmj', 'ww5cmjs', 'ww5cmjsb']
+    """
+    geohash = encode_geohash(longitude, latitude, max(GEOHASH_PRECISIONS))
+    return [geohash[:precision] for precision in GEOHASH_PRECISIONS]
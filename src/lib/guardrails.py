@@ -0,0 +1,179 @@
+r"""
+Checks that limit the cost of the queries that clients send us (e.g. via `POST /bertron/find`),
+so that a single expensive query cannot slow down the MongoDB server for everyone else.
+"""
+
+from typing import Any, Dict, Iterator, List
+
+# The query operators that filters may use. Operators that run arbitrary code (e.g. `$where`
+# and `$function`) or that MongoDB cannot evaluate via an index (e.g. `$expr`) are excluded.
+# Reference: https://www.mongodb.com/docs/manual/reference/operator/query/
+ALLOWED_QUERY_OPERATORS = frozenset(
+    [
+        # Comparison
+        "$eq",
+        "$ne",
+        "$gt",
+        "$gte",
+        "$lt",
+        "$lte",
+        "$in",
+        "$nin",
+        # Logical
+        "$and",
+        "$or",
+        "$nor",
+        "$not",
+        # Element
+        "$exists",
+        "$type",
+        # Evaluation
+        "$regex",
+        "$options",
+        # Array
+        "$all",
+        "$elemMatch",
+        "$size",
+        # Geospatial
+        "$geoWithin",
+        "$geoIntersects",
+        "$near",
+        "$nearSphere",
+        "$geometry",
+        "$box",
+        "$polygon",
+        "$center",
+        "$centerSphere",
+        "$minDistance",
+        "$maxDistance",
+    ]
+)
+
+
+def disallowed_operators(filter: Any) -> List[str]:
+    r"""
+    Returns the names (in sorted order) of the operators in the filter that are not in
+    `ALLOWED_QUERY_OPERATORS`.
+
+    >>> disallowed_operators({"name": {"$regex": "^Soil"}, "$or": [{"a": 1}, {"b": 2}]})
+    []
+    >>> disallowed_operators({"$where": "sleep(1000)", "a": {"$elemMatch": {"$expr": 1}}})
+    ['$expr', '$where']
+    """
+    operators = set()
+
+    def visit(value: Any) -> None:
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key.startswith("$") and key not in ALLOWED_QUERY_OPERATORS:
+                    operators.add(key)
+                visit(item)
+        elif isinstance(value, list):
+            for item in value:
+                visit(item)
+
+    visit(filter)
+    return sorted(operators)
+
+
+def disallowed_projection_fields(projection: Dict[str, Any]) -> List[str]:
+    r"""
+    Returns the names (in sorted order) of the fields whose values in the projection are not
+    `0`, `1`, `True`, or `False`; i.e. whose values are expressions (e.g. `$function`) or
+    projection operators, which MongoDB would evaluate for every document it returns.
+
+    >>> disallowed_projection_fields({"id": 1, "name": True, "description": 0})
+    []
+    >>> disallowed_projection_fields({"name": {"$function": {}}, "id": "$_metadata", "a": 2})
+    ['a', 'id', 'name']
+    """
+    return sorted(
+        key
+        for key, value in projection.items()
+        if not (isinstance(value, bool) or (isinstance(value, int) and value in (0, 1)))
+    )
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    r"""
+    Yields the stages of a query plan (e.g. the `winningPlan` of the output of an `explain`
+    command), including the stages they get their input from.
+    """
+    # Note: MongoDB nests the plan within `queryPlan` when it uses the slot-based
+    #       execution engine.
+    plan = plan.get("queryPlan", plan)
+    yield plan
+    if "inputStage" in plan:
+        yield from plan_nodes(plan["inputStage"])
+    for input_stage in plan.get("inputStages", []):
+        yield from plan_nodes(input_stage)
+
+
+def plan_stages(plan: Dict[str, Any]) -> Iterator[str]:
+    r"""
+    Yields the names of the stages of a query plan (e.g. the `winningPlan` of the output of
+    an `explain` command), including those of the stages they get their input from.
+
+    >>> plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    >>> list(plan_stages(plan))
+    ['FETCH', 'IXSCAN']
+    >>> plan = {"queryPlan": {"stage": "OR", "inputStages": [{"stage": "COLLSCAN"}]}}
+    >>> list(plan_stages(plan))
+    ['OR', 'COLLSCAN']
+    """
+    for node in plan_nodes(plan):
+        if "stage" in node:
+            yield node["stage"]
+
+
+# The bounds of an index scan that reads every key of the index (in either direction).
+UNBOUNDED_INDEX_BOUNDS = (["[MinKey, MaxKey]"], ["[MaxKey, MinKey]"])
+
+
+def is_full_index_scan(plan: Dict[str, Any]) -> bool:
+    r"""
+    Returns `True` if the stage of a query plan reads every key of an index.
+
+    >>> is_full_index_scan({"stage": "IXSCAN", "indexBounds": {"id": ["[MinKey, MaxKey]"]}})
+    True
+    >>> is_full_index_scan({"stage": "IXSCAN", "indexBounds": {"id": ['["a", "a"]']}})
+    False
+    """
+    bounds = plan.get("indexBounds", {})
+    return (
+        plan.get("stage") == "IXSCAN"
+        and len(bounds) > 0
+        and all(key_bounds in UNBOUNDED_INDEX_BOUNDS for key_bounds in bounds.values())
+    )
+
+
+def is_collection_scan(explanation: Dict[str, Any]) -> bool:
+    r"""
+    Returns `True` if the winning plan in the output of an `explain` command reads the
+    whole collection (instead of using an index to find the matching documents).
+
+    Besides a `COLLSCAN`, that includes a `FETCH` that filters the documents it gets from a
+    scan of a whole index; which is how MongoDB evaluates a filter on unindexed fields when
+    the sort is on an indexed field (e.g. the `id` field, by which we sort pages).
+
+    >>> is_collection_scan({"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}})
+    True
+    >>> scan = {"stage": "IXSCAN", "indexBounds": {"id": ["[MinKey, MaxKey]"]}}
+    >>> fetch = {"stage": "FETCH", "filter": {"description": {"$eq": "x"}}, "inputStage": scan}
+    >>> is_collection_scan({"queryPlanner": {"winningPlan": fetch}})
+    True
+    >>> del fetch["filter"]
+    >>> is_collection_scan({"queryPlanner": {"winningPlan": fetch}})
+    False
+    """
+    winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    for node in plan_nodes(winning_plan):
+        if node.get("stage") == "COLLSCAN":
+            return True
+        if (
+            node.get("stage") == "FETCH"
+            and "filter" in node
+            and is_full_index_scan(node.get("inputStage", {}))
+        ):
+            return True
+    return False
@@ -0,0 +1,215 @@
+r"""
+Parses JSON files incrementally, so that the ingest script can process a file containing a
+huge array of entities (or one entity per line) without holding the whole file in memory.
+
+The parser reads the file in chunks and decodes the elements of the top-level array one at a
+time, via the standard library's `json.JSONDecoder.raw_decode`; so it keeps only (roughly)
+one chunk, plus the element being decoded, in memory.
+"""
+
+import json
+from typing import Any, Iterator, TextIO
+
+# The number of characters we read from a file at a time.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# The maximum number of characters of a single element of the array (e.g. a single entity).
+# Note: This bounds the memory we use to decode a file, even if it is malformed (e.g. if it
+#       contains a string that is never terminated).
+DEFAULT_MAX_ELEMENT_SIZE = 1 << 26
+
+# The number of characters from the end of the buffer within which decoding can stop (or
+# fail) merely because the buffer ends there; e.g. `1.` may be the beginning of `1.5`, and
+# `tru` may be the beginning of `true`.
+INCOMPLETE_TAIL_SIZE = 8
+
+# The characters that JSON allows between values.
+WHITESPACE = " \t\n\r"
+
+
+class JsonStreamDecodeError(json.JSONDecodeError):
+    r"""
+    A `json.JSONDecodeError` whose message says where in the file (rather than where in the
+    part of the file that was being decoded) the problem is.
+    """
+
+    def __str__(self) -> str:
+        return self.msg
+
+
+class JsonStreamReader:
+    r"""
+    Class that buffers the text of a JSON file, reading more of it only as needed.
+    """
+
+    def __init__(
+        self,
+        f: TextIO,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_element_size: int = DEFAULT_MAX_ELEMENT_SIZE,
+    ):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_element_size = max_element_size
+        self.buffer = ""
+        self.pos = 0  # the position in the buffer of the next character to parse
+        self.offset = 0  # the position in the file of the first character in the buffer
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def read_more(self) -> None:
+        r"""
+        Discards the parsed part of the buffer, and appends (at least) a chunk of the file
+        to it; or sets `eof` if the file has no more characters.
+        """
+        # Note: We read at least as much as the buffer holds, so that decoding a value
+        #       spanning many chunks re-parses its beginning only a logarithmic number of
+        #       times.
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer)))
+        if chunk:
+            self.buffer += chunk
+        else:
+            self.eof = True
+
+    def peek(self) -> str:
+        r"""Skips whitespace, and returns the next character (or `""` at the end of the file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self.read_more()
+
+    def expect(self, character: str) -> None:
+        r"""Consumes the next (non-whitespace) character, which must be the specified one."""
+        if self.peek() != character:
+            raise self.error(f"Expecting '{character}'", self.pos)
+        self.pos += 1
+
+    def error(self, message: str, pos: int) -> JsonStreamDecodeError:
+        r"""Returns an error describing the problem at the position in the buffer."""
+        message = f"{message} (at character {self.offset + pos} of the file)"
+        return JsonStreamDecodeError(message, self.buffer, pos)
+
+    def is_near_end(self, pos: int) -> bool:
+        r"""Returns `True` if the buffer may end too soon to tell what is at the position."""
+        return not self.eof and len(self.buffer) - pos <= INCOMPLETE_TAIL_SIZE
+
+    def decode_element(self) -> Any:
+        r"""
+        Decodes the array element that starts at the next (non-whitespace) character.
+
+        We only read more of the file if the element may continue beyond the end of the
+        buffer, so we raise an error as soon as we reach any malformed part of the file.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if not self.is_near_end(end):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                # Note: A string that is not terminated within the buffer is reported at
+                #       its beginning (rather than where the buffer ends).
+                is_incomplete = self.is_near_end(e.pos) or (
+                    not self.eof and e.msg.startswith("Unterminated string")
+                )
+                if not is_incomplete:
+                    raise self.error(e.msg, e.pos) from e
+            if len(self.buffer) - self.pos >= self.max_element_size:
+                raise self.error(
+                    f"Element is larger than {self.max_element_size} characters",
+                    self.pos,
+                )
+            self.read_more()
+
+
+def iter_json_values(
+    f: TextIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_element_size: int = DEFAULT_MAX_ELEMENT_SIZE,
+) -> Iterator[Any]:
+    r"""
+    Yields the elements of the JSON array in the file, decoding each one as the file is read;
+    or, if the file contains some other JSON value (e.g. a single entity), yields that value.
+
+    Raises a `json.JSONDecodeError` upon reaching any part of the file that is not valid JSON,
+    or any element having more than `max_element_size` characters.
+
+    >>> from io import StringIO
+    >>> list(iter_json_values(StringIO('[{"id": "a"}, 123, [4.5e6] ]'), chunk_size=2))
+    [{'id': 'a'}, 123, [4500000.0]]
+    >>> list(iter_json_values(StringIO(' {"id": "a"} ')))
+    [{'id': 'a'}]
+    >>> list(iter_json_values(StringIO('[]')))
+    []
+    >>> next(iter_json_values(StringIO('[1, 2,]'), chunk_size=2))
+    1
+    >>> try:
+    ...     list(iter_json_values(StringIO('[1, 2,]'), chunk_size=2))
+    ... except json.JSONDecodeError as e:
+    ...     print(e)
+    Expecting value (at character 6 of the file)
+
+    A malformed element is reported without reading the rest of the file:
+
+    >>> f = StringIO('[{"id": x}, ' + '{"id": "a"}, ' * 10000 + '{}]')
+    >>> try:
+    ...     list(iter_json_values(f, chunk_size=16))
+    ... except json.JSONDecodeError as e:
+    ...     print(e, "| characters read:", f.tell())
+    Expecting value (at character 8 of the file) | characters read: 32
+    >>> try:
+    ...     list(iter_json_values(StringIO('["' + "a" * 1000), 16, max_element_size=100))
+    ... except json.JSONDecodeError as e:
+    ...     print(e)
+    Element is larger than 100 characters (at character 1 of the file)
+    """
+    reader = JsonStreamReader(f, chunk_size, max_element_size)
+    if reader.peek() != "[":
+        value = reader.decode_element()
+        if reader.peek() != "":
+            raise reader.error("Extra data", reader.pos)
+        yield value
+        return
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+    else:
+        while True:
+            yield reader.decode_element()
+            if reader.peek() == "]":
+                reader.pos += 1
+                break
+            reader.expect(",")
+    if reader.peek() != "":
+        raise reader.error("Extra data", reader.pos)
+
+
+def iter_json_lines(f: TextIO) -> Iterator[Any]:
+    r"""
+    Yields the JSON value on each (non-blank) line of the file (i.e. of an NDJSON file).
+
+    Raises a `json.JSONDecodeError` upon reaching a line that is not valid JSON.
+
+    >>> from io import StringIO
+    >>> list(iter_json_lines(StringIO('{"id": "a"}\n\n{"id": "b"}\n')))
+    [{'id': 'a'}, {'id': 'b'}]
+    >>> try:
+    ...     list(iter_json_lines(StringIO('{"id": "a"}\n{"id": }\n')))
+    ... except json.JSONDecodeError as e:
+    ...     print(e)
+    Expecting value (on line 2, at column 8)
+    """
+    for line_number, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                message = f"{e.msg} (on line {line_number}, at column {e.colno})"
+                raise JsonStreamDecodeError(message, e.doc, e.pos) from e
@@ -0,0 +1,199 @@
+r"""
+A minimal encoder of Mapbox Vector Tiles containing points.
+
+A vector tile is a Protocol Buffers message; since we only ever encode one layer of points
+(having a few string attributes each), we encode the message directly instead of depending
+on a Protocol Buffers library.
+
+References:
+- https://github.com/mapbox/vector-tile-spec/blob/master/2.1/README.md
+- https://github.com/mapbox/vector-tile-spec/blob/master/2.1/vector_tile.proto
+- https://protobuf.dev/programming-guides/encoding/
+"""
+
+import math
+import struct
+from typing import Dict, Iterable, List, Tuple, Union
+
+from lib.geo import BoundingBox
+
+# The media type of Mapbox Vector Tiles.
+# Reference: https://www.iana.org/assignments/media-types/application/vnd.mapbox-vector-tile
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# The number of units (per axis) in the coordinate system of each tile.
+DEFAULT_EXTENT = 4096
+
+# The latitude beyond which the Web Mercator projection (used by web maps) does not extend.
+MAX_MERCATOR_LATITUDE = 85.0511287798066
+
+# An attribute value; i.e. a string, boolean, integer, or floating-point number.
+Value = Union[str, bool, int, float]
+
+# A point feature, as `(x, y, attributes)` in tile coordinates.
+PointFeature = Tuple[int, int, Dict[str, Value]]
+
+# Protocol Buffers wire types.
+VARINT = 0
+I64 = 1
+LEN = 2
+
+# The geometry type of point features, and the "MoveTo" command with which they are drawn.
+POINT_GEOMETRY_TYPE = 1
+MOVE_TO_COMMAND = 1
+
+
+def tile_bounds(z: int, x: int, y: int) -> BoundingBox:
+    r"""
+    Returns the bounding box (in degrees) of the specified Web Mercator tile.
+
+    >>> tile_bounds(0, 0, 0) == (-180.0, -MAX_MERCATOR_LATITUDE, 180.0, MAX_MERCATOR_LATITUDE)
+    True
+    >>> [round(c, 4) for c in tile_bounds(1, 1, 0)]
+    [0.0, 0.0, 180.0, 85.0511]
+    """
+    num_tiles = 2**z
+
+    def latitude(tile_y: int) -> float:
+        return math.degrees(
+            math.atan(math.sinh(math.pi * (1 - 2 * tile_y / num_tiles)))
+        )
+
+    west = x / num_tiles * 360 - 180
+    east = (x + 1) / num_tiles * 360 - 180
+    return west, latitude(y + 1), east, latitude(y)
+
+
+def project_to_tile(
+    longitude: float,
+    latitude: float,
+    z: int,
+    x: int,
+    y: int,
+    extent: int = DEFAULT_EXTENT,
+) -> Tuple[int, int]:
+    r"""
+    Returns the position of the point within the coordinate system of the specified tile,
+    whose origin is the tile's top-left corner. Positions outside the tile are not clamped.
+
+    >>> project_to_tile(0, 0, 0, 0, 0)
+    (2048, 2048)
+    >>> project_to_tile(-180, MAX_MERCATOR_LATITUDE, 1, 0, 0)
+    (0, 0)
+    >>> project_to_tile(90, 0, 1, 0, 0)
+    (6144, 4096)
+    """
+    num_tiles = 2**z
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    world_x = (longitude + 180) / 360
+    sin_latitude = math.sin(math.radians(latitude))
+    world_y = 0.5 - math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi)
+    return (
+        round((world_x * num_tiles - x) * extent),
+        round((world_y * num_tiles - y) * extent),
+    )
+
+
+def encode_point_layer(
+    name: str, features: Iterable[PointFeature], extent: int = DEFAULT_EXTENT
+) -> bytes:
+    r"""
+    Returns a vector tile consisting of a single layer of point features.
+
+    >>> encode_point_layer("e", [(1, 2, {"id": "a"})])
+    b'\x1a\x1ex\x02\n\x01e\x12\x0b\x12\x02\x00\x00\x18\x01"\x03\t\x02\x04\x1a\x02id"\x03\n\x01a(\x80 '
+    >>> encode_point_layer("entities", [])
+    b''
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Value], int] = {}
+    encoded_features: List[bytes] = []
+    for feature_x, feature_y, attributes in features:
+        tags: List[int] = []
+        for key, value in attributes.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        geometry = [
+            command_integer(MOVE_TO_COMMAND, 1),
+            zigzag(feature_x),
+            zigzag(feature_y),
+        ]
+        encoded_features.append(
+            field(2, LEN, packed(tags))
+            + field(3, VARINT, varint(POINT_GEOMETRY_TYPE))
+            + field(4, LEN, packed(geometry))
+        )
+    if len(encoded_features) == 0:
+        return b""
+
+    layer = field(15, VARINT, varint(2))  # version
+    layer += field(1, LEN, name.encode())
+    layer += b"".join(field(2, LEN, feature) for feature in encoded_features)
+    layer += b"".join(field(3, LEN, key.encode()) for key in keys)
+    layer += b"".join(field(4, LEN, encode_value(value)) for _, value in values)
+    layer += field(5, VARINT, varint(extent))
+    return field(3, LEN, layer)
+
+
+def encode_value(value: Value) -> bytes:
+    r"""
+    Returns the encoded `Value` message representing the value.
+
+    >>> encode_value("a"), encode_value(True), encode_value(-1), encode_value(0.5)
+    (b'\n\x01a', b'8\x01', b'0\x01', b'\x19\x00\x00\x00\x00\x00\x00\xe0?')
+    """
+    if isinstance(value, str):
+        return field(1, LEN, value.encode())
+    if isinstance(value, bool):
+        return field(7, VARINT, varint(int(value)))
+    if isinstance(value, int):
+        return field(6, VARINT, varint(zigzag(value)))
+    return field(3, I64, struct_double(value))
+
+
+def field(number: int, wire_type: int, payload: bytes) -> bytes:
+    r"""Returns the encoded field, having the specified number, wire type and payload."""
+    if wire_type == LEN:
+        payload = varint(len(payload)) + payload
+    return varint(number << 3 | wire_type) + payload
+
+
+def packed(integers: List[int]) -> bytes:
+    r"""Returns the integers encoded as a packed repeated field's payload."""
+    return b"".join(varint(integer) for integer in integers)
+
+
+def varint(integer: int) -> bytes:
+    r"""
+    Returns the non-negative integer encoded as a variable-length integer.
+
+    >>> varint(1), varint(300)
+    (b'\x01', b'\xac\x02')
+    """
+    encoded = bytearray()
+    while integer >= 0x80:
+        encoded.append(integer & 0x7F | 0x80)
+        integer >>= 7
+    encoded.append(integer)
+    return bytes(encoded)
+
+
+def zigzag(integer: int) -> int:
+    r"""
+    Returns the (signed) integer mapped onto a non-negative integer, so that integers having
+    small absolute values are encoded into few bytes.
+
+    >>> [zigzag(i) for i in (0, -1, 1, -2, 2)]
+    [0, 1, 2, 3, 4]
+    """
+    return (integer << 1) ^ (integer >> 63)
+
+
+def command_integer(command: int, count: int) -> int:
+    r"""Returns the integer representing a geometry command that is repeated `count` times."""
+    return command & 0x7 | count << 3
+
+
+def struct_double(number: float) -> bytes:
+    r"""Returns the number encoded as a little-endian double."""
+    return struct.pack("<d", number)
@@ -0,0 +1,286 @@
+r"""
+Helpers for keyset (a.k.a. "cursor-token") pagination of MongoDB queries.
+
+Instead of skipping over the documents on previous pages (which MongoDB has to walk
+through one by one), each page ends with an opaque continuation token that records the
+sort key values of the last document returned. The next page is then fetched by filtering
+on "sort key values after the ones in the token", which an index on the sort keys can
+answer directly. Ties are broken by the unique `id` field, so the order is always total.
+
+Since a continuation token records a single value per sort key, pages cannot be sorted by
+fields whose values are arrays: MongoDB sorts a document by the smallest (or largest) element
+of such a field, but `$gt` and `$lt` match a document if any element of it matches; so pages
+could skip or repeat documents.
+
+Results of `$geoNear` queries, which are ordered by their (computed) distance from a point,
+are paginated similarly; except that their continuation tokens record the distance of the
+last document returned, and the `id`s of the documents returned at that distance.
+
+References:
+- https://www.mongodb.com/docs/manual/reference/method/cursor.skip/#using-range-queries
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+
+# The field used to break ties between documents whose sort key values are equal.
+# Note: The ingest script creates a unique index on this field.
+TIEBREAKER_FIELD = "id"
+
+SortSpec = List[Tuple[str, int]]
+
+
+def keyset_sort(
+    sort: Optional[Dict[str, int]] = None, is_paginated: bool = True
+) -> SortSpec:
+    r"""
+    Returns the sort specification used for keyset pagination; i.e. the requested one,
+    followed by an ascending sort on the tiebreaker field (unless already present).
+
+    When neither a sort nor pagination is requested, returns an empty specification, so that
+    MongoDB is free to read the matching documents via whichever index suits the filter.
+
+    >>> keyset_sort()
+    [('id', 1)]
+    >>> keyset_sort(is_paginated=False)
+    []
+    >>> keyset_sort({"ber_data_source": -1}, is_paginated=False)
+    [('ber_data_source', -1), ('id', 1)]
+    >>> keyset_sort({"id": -1, "name": 1})
+    [('id', -1), ('name', 1)]
+    """
+    spec = list((sort or {}).items())
+    if len(spec) == 0 and not is_paginated:
+        return spec
+    if TIEBREAKER_FIELD not in (key for key, _ in spec):
+        spec.append((TIEBREAKER_FIELD, 1))
+    return spec
+
+
+def get_path(document: Dict[str, Any], path: str) -> Any:
+    r"""
+    Returns the value at the specified dot-separated path within the document,
+    or `None` if there is no value there.
+
+    >>> get_path({"a": {"b": 1}}, "a.b")
+    1
+    >>> get_path({"a": {"b": 1}}, "a.c") is None
+    True
+    >>> get_path({"a": [1, 2]}, "a.b") is None
+    True
+    """
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def pop_path(document: Dict[str, Any], path: str) -> None:
+    r"""
+    Removes the value at the specified dot-separated path from the document, along with
+    any parent documents that are left empty as a result.
+
+    >>> doc = {"a": {"b": 1}, "c": 2}
+    >>> pop_path(doc, "a.b")
+    >>> doc
+    {'c': 2}
+    >>> doc = {"a": {"b": 1, "d": 3}}
+    >>> pop_path(doc, "a.b")
+    >>> doc
+    {'a': {'d': 3}}
+    """
+    head, _, rest = path.partition(".")
+    if rest == "":
+        document.pop(head, None)
+        return
+    child = document.get(head)
+    if isinstance(child, dict):
+        pop_path(child, rest)
+        if len(child) == 0:
+            document.pop(head)
+
+
+def encode_token(sort: SortSpec, document: Dict[str, Any]) -> str:
+    r"""
+    Returns an opaque continuation token recording the sort key values of the document.
+
+    >>> token = encode_token([("id", 1)], {"id": "nmdc:123", "name": "x"})
+    >>> decode_token(token, [("id", 1)])
+    ['nmdc:123']
+    """
+    payload = {
+        "s": [[key, direction] for key, direction in sort],
+        "v": [get_path(document, key) for key, _ in sort],
+    }
+    return dump_token(payload)
+
+
+def decode_token(token: str, sort: SortSpec) -> List[Any]:
+    r"""
+    Returns the sort key values recorded in the continuation token.
+
+    Raises a `ValueError` if the token is malformed or was issued for a different sort.
+
+    >>> decode_token("not-a-token", [("id", 1)])
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid continuation token
+    >>> token = encode_token([("id", 1)], {"id": "nmdc:123"})
+    >>> decode_token(token, [("name", 1), ("id", 1)])
+    Traceback (most recent call last):
+    ...
+    ValueError: Continuation token does not match the requested sort order
+    """
+    try:
+        payload = load_token(token)
+        token_sort = [(key, direction) for key, direction in payload["s"]]
+        values = list(payload["v"])
+    except (TypeError, KeyError):
+        raise ValueError("Invalid continuation token")
+    if token_sort != sort or len(values) != len(sort):
+        raise ValueError("Continuation token does not match the requested sort order")
+    return values
+
+
+def encode_distance_token(distance: float, ids: List[str], num_returned: int) -> str:
+    r"""
+    Returns an opaque continuation token for a page of results ordered by distance, recording
+    the distance of the last document on the page, the `id`s of the documents returned so
+    far at that distance, and the number of documents returned so far (on all pages).
+
+    >>> decode_distance_token(encode_distance_token(12.5, ["nmdc:123"], 20))
+    (12.5, ['nmdc:123'], 20)
+    """
+    return dump_token({"d": distance, "i": ids, "n": num_returned})
+
+
+def decode_distance_token(token: str) -> Tuple[float, List[str], int]:
+    r"""
+    Returns the distance, `id`s, and number of documents recorded in the continuation token.
+
+    Raises a `ValueError` if the token is malformed or was not issued for distance ordering.
+
+    >>> decode_distance_token(encode_token([("id", 1)], {"id": "nmdc:123"}))
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid continuation token
+    """
+    try:
+        payload = load_token(token)
+        return float(payload["d"]), [str(id) for id in payload["i"]], int(payload["n"])
+    except (TypeError, KeyError):
+        raise ValueError("Invalid continuation token")
+
+
+def dump_token(payload: Dict[str, Any]) -> str:
+    r"""
+    Returns the payload serialized as an opaque continuation token.
+
+    Note: We use MongoDB Extended JSON so that BSON-specific types (e.g. dates) survive
+          the round trip through the token.
+    """
+    serialized = json_util.dumps(payload, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(serialized.encode("utf-8")).decode("ascii")
+
+
+def load_token(token: str) -> Dict[str, Any]:
+    r"""Returns the payload of the continuation token, raising a `ValueError` if it is malformed."""
+    try:
+        serialized = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        payload = json_util.loads(serialized)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise ValueError("Invalid continuation token")
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid continuation token")
+    return payload
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> Dict[str, Any]:
+    r"""
+    Returns a MongoDB filter matching the documents that come after the ones having the
+    specified sort key values, in the specified sort order.
+
+    Note: MongoDB sorts `null` (and missing) values before all others. Since comparison
+          operators only match values of the same BSON type, we spell out the `null`
+          cases explicitly.
+
+    >>> keyset_filter([("id", 1)], ["b"])
+    {'$or': [{'id': {'$gt': 'b'}}]}
+    >>> keyset_filter([("name", -1), ("id", 1)], ["x", "b"])["$or"][0]
+    {'$or': [{'name': {'$lt': 'x'}}, {'name': None}]}
+    >>> keyset_filter([("name", -1), ("id", 1)], ["x", "b"])["$or"][1]
+    {'name': 'x', 'id': {'$gt': 'b'}}
+    >>> keyset_filter([("name", 1), ("id", 1)], [None, "b"])["$or"][0]
+    {'name': {'$ne': None}}
+    """
+    clauses: List[Dict[str, Any]] = []
+    for index, (key, direction) in enumerate(sort):
+        equalities = {
+            prefix_key: values[i] for i, (prefix_key, _) in enumerate(sort[:index])
+        }
+        value = values[index]
+        if direction >= 0:
+            after = {key: {"$ne": None}} if value is None else {key: {"$gt": value}}
+        else:
+            if value is None:
+                continue  # nothing sorts after `null` in descending order
+            after = {"$or": [{key: {"$lt": value}}, {key: None}]}
+        clauses.append({**equalities, **after})
+    return {"$or": clauses} if clauses else {TIEBREAKER_FIELD: {"$in": []}}
+
+
+def is_inclusion_projection(projection: Dict[str, Any]) -> bool:
+    r"""
+    Returns `True` if the projection lists the fields to include (as opposed to the
+    fields to exclude).
+
+    >>> is_inclusion_projection({"id": 1, "_id": 0})
+    True
+    >>> is_inclusion_projection({"properties": 0})
+    False
+    """
+    return any(
+        key != "_id" and not isinstance(value, dict) and bool(value)
+        for key, value in projection.items()
+    )
+
+
+def projection_with_keys(
+    projection: Optional[Dict[str, Any]], keys: List[str]
+) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    r"""
+    Returns a copy of the projection adjusted so the documents it yields contain the
+    specified keys, along with the list of keys that were added (so the caller can
+    remove them from the documents afterward).
+
+    >>> projection_with_keys(None, ["id"])
+    (None, [])
+    >>> projection_with_keys({"name": 1}, ["name", "id"])
+    ({'name': 1, 'id': 1}, ['id'])
+    >>> projection_with_keys({"coordinates": 1}, ["coordinates.latitude"])
+    ({'coordinates': 1}, [])
+    >>> projection_with_keys({"id": 0, "properties": 0}, ["id"])
+    ({'properties': 0}, ['id'])
+    """
+    if projection is None:
+        return None, []
+    adjusted = dict(projection)
+    added: List[str] = []
+    if is_inclusion_projection(adjusted):
+        for key in keys:
+            parts = key.split(".")
+            ancestors = {".".join(parts[: i + 1]) for i in range(len(parts))}
+            if not any(adjusted.get(ancestor) for ancestor in ancestors):
+                adjusted[key] = 1
+                added.append(key)
+    else:
+        for key in keys:
+            if key in adjusted and not adjusted[key]:
+                del adjusted[key]
+                added.append(key)
+    return adjusted, added
@@ -0,0 +1,160 @@
+r"""
+Encodes the locations of entities into a compact binary format, which a browser can view as
+typed arrays (e.g. a `Float32Array`) without parsing each value.
+
+The format consists of the following sections; each of which starts at a multiple of 4 bytes
+(the previous section being padded with zero bytes), so a browser can view it in place.
+All numbers are little-endian.
+
+1. A header: the magic bytes `POINTS_MAGIC`, followed by three `uint32`s: the version of the
+   format, the number of points (`n`), and the number of BER data sources (`k`).
+2. The longitudes of the points (`n` `float32`s).
+3. The latitudes of the points (`n` `float32`s).
+4. The BER data source of each point (`n` `uint8`s), as its position in the table of BER
+   data sources.
+5. The table of BER data sources (a string table of `k` strings).
+6. The table of the `id`s of the points (a string table of `n` strings).
+
+A string table consists of `count + 1` `uint32` offsets, followed by the UTF-8 encoded
+strings; the bytes of the `i`th string are those from offset `i` to offset `i + 1`
+(counting from the start of the strings).
+"""
+
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# The media type of the binary point feed.
+POINTS_MEDIA_TYPE = "application/octet-stream"
+
+# The bytes with which the binary point feed begins, and the version of its format.
+POINTS_MAGIC = b"BERP"
+POINTS_FORMAT_VERSION = 1
+
+# The maximum number of BER data sources the format can represent (since it encodes the
+# BER data source of each point as a `uint8`).
+MAX_SOURCES = 256
+
+# A point, as `(id, longitude, latitude, ber_data_source)`.
+Point = Tuple[str, float, float, str]
+
+HEADER_FORMAT = "<4sIII"
+
+
+def encode_points(points: Iterable[Point]) -> bytes:
+    r"""
+    Returns the binary point feed describing the points.
+
+    Raises a `ValueError` if the points have more than `MAX_SOURCES` BER data sources.
+
+    >>> data = encode_points([("a", 1.5, -2.0, "NMDC"), ("b", 3.0, 4.0, "EMSL")])
+    >>> len(data), data[:4]
+    (72, b'BERP')
+    >>> decode_points(data)
+    [('a', 1.5, -2.0, 'NMDC'), ('b', 3.0, 4.0, 'EMSL')]
+    """
+    ids: List[str] = []
+    longitudes = array("f")
+    latitudes = array("f")
+    source_codes = array("B")
+    sources: Dict[str, int] = {}
+    for id, longitude, latitude, source in points:
+        if source not in sources and len(sources) == MAX_SOURCES:
+            raise ValueError(f"Cannot encode more than {MAX_SOURCES} BER data sources")
+        ids.append(id)
+        longitudes.append(longitude)
+        latitudes.append(latitude)
+        source_codes.append(sources.setdefault(source, len(sources)))
+
+    if sys.byteorder != "little":  # pragma: no cover
+        longitudes.byteswap()
+        latitudes.byteswap()
+
+    header = struct.pack(
+        HEADER_FORMAT, POINTS_MAGIC, POINTS_FORMAT_VERSION, len(ids), len(sources)
+    )
+    sections = [
+        header,
+        longitudes.tobytes(),
+        latitudes.tobytes(),
+        source_codes.tobytes(),
+        encode_string_table(list(sources)),
+        encode_string_table(ids),
+    ]
+    return b"".join(pad(section) for section in sections)
+
+
+def decode_points(data: bytes) -> List[Point]:
+    r"""
+    Returns the points described by the binary point feed.
+
+    Raises a `ValueError` if the data is not a binary point feed of a supported version.
+    """
+    header_size = struct.calcsize(HEADER_FORMAT)
+    magic, version, num_points, num_sources = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != POINTS_MAGIC or version != POINTS_FORMAT_VERSION:
+        raise ValueError("The data is not a supported binary point feed")
+
+    offset = header_size
+    longitudes = array("f", data[offset : offset + 4 * num_points])
+    offset += 4 * num_points
+    latitudes = array("f", data[offset : offset + 4 * num_points])
+    offset += 4 * num_points
+    if sys.byteorder != "little":  # pragma: no cover
+        longitudes.byteswap()
+        latitudes.byteswap()
+    source_codes = data[offset : offset + num_points]
+    offset += padded_length(num_points)
+    sources, offset = decode_string_table(data, offset, num_sources)
+    ids, _ = decode_string_table(data, offset, num_points)
+    return [
+        (ids[i], longitudes[i], latitudes[i], sources[source_codes[i]])
+        for i in range(num_points)
+    ]
+
+
+def encode_string_table(strings: Sequence[str]) -> bytes:
+    r"""
+    Returns the string table containing the strings.
+
+    >>> encode_string_table(["ab", "c"])
+    b'\x00\x00\x00\x00\x02\x00\x00\x00\x03\x00\x00\x00abc'
+    """
+    encoded_strings = [string.encode() for string in strings]
+    offsets = array("I", [0])
+    for encoded_string in encoded_strings:
+        offsets.append(offsets[-1] + len(encoded_string))
+    if sys.byteorder != "little":  # pragma: no cover
+        offsets.byteswap()
+    return offsets.tobytes() + b"".join(encoded_strings)
+
+
+def decode_string_table(data: bytes, offset: int, count: int) -> Tuple[List[str], int]:
+    r"""
+    Returns the strings in the string table at the offset, and the offset of the (padded)
+    end of the table.
+    """
+    offsets = array("I", data[offset : offset + 4 * (count + 1)])
+    if sys.byteorder != "little":  # pragma: no cover
+        offsets.byteswap()
+    start = offset + 4 * (count + 1)
+    strings = [
+        data[start + offsets[i] : start + offsets[i + 1]].decode() for i in range(count)
+    ]
+    return strings, start + padded_length(offsets[-1])
+
+
+def padded_length(length: int) -> int:
+    r"""
+    Returns the length rounded up to a multiple of 4.
+
+    >>> [padded_length(n) for n in (0, 1, 4, 5)]
+    [0, 4, 4, 8]
+    """
+    return (length + 3) // 4 * 4
+
+
+def pad(section: bytes) -> bytes:
+    r"""Returns the section followed by enough zero bytes to make its length a multiple of 4."""
+    return section + bytes(padded_length(len(section)) - len(section))
@@ -0,0 +1,48 @@
+import time
+from typing import Dict, Tuple
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+
+class CollectionRegistry:
+    r"""
+    A process-level record of which MongoDB collections are known to exist.
+
+    Request handlers use this to decide whether to respond with a "collection not found"
+    error, without having to ask the MongoDB server about the collection on every request.
+
+    A collection's existence is confirmed (via a single, filtered `listCollections` command)
+    the first time it is asked about, and again once its confirmation is older than the TTL.
+    Collections that are _not_ known to exist are always re-checked, so a collection created
+    after the application starts up (e.g. by the ingest script) is picked up right away.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        # Maps `(database name, collection name)` to when the collection was last seen.
+        self._confirmed_at: Dict[Tuple[str, str], float] = {}
+
+    async def exists(self, db: AsyncDatabase, collection_name: str) -> bool:
+        r"""Returns `True` if the collection is known to exist, checking with the server only if necessary."""
+        confirmed_at = self._confirmed_at.get((db.name, collection_name))
+        if (
+            confirmed_at is not None
+            and time.monotonic() - confirmed_at < self.ttl_seconds
+        ):
+            return True
+        return await self.refresh(db, collection_name)
+
+    async def refresh(self, db: AsyncDatabase, collection_name: str) -> bool:
+        r"""Asks the server whether the collection exists, records the answer, and returns it."""
+        collection_names = await db.list_collection_names(
+            filter={"name": collection_name}
+        )
+        if collection_name in collection_names:
+            self._confirmed_at[(db.name, collection_name)] = time.monotonic()
+            return True
+        self.forget(db, collection_name)
+        return False
+
+    def forget(self, db: AsyncDatabase, collection_name: str) -> None:
+        r"""Discards what is known about the collection, so it is re-checked next time."""
+        self._confirmed_at.pop((db.name, collection_name), None)
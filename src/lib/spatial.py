@@ -0,0 +1,232 @@
+r"""
+An in-memory index of the locations of entities, which can answer geospatial queries
+without querying MongoDB.
+
+The index keeps the `id` and `[longitude, latitude]` of every entity in NumPy arrays,
+sorted by the cell of a 1-degree grid in which each entity is located. To answer a query,
+it looks up the (contiguous) ranges of entities in the grid cells overlapping the query's
+area, and then checks those candidates exactly.
+
+Note: NumPy is an optional dependency (see the `spatial` extra in `pyproject.toml`),
+      which is only needed when the spatial index is enabled.
+"""
+
+import asyncio
+import math
+from typing import Any, Hashable, List, Optional, Sequence, Tuple
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from lib.geo import BoundingBox
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore[assignment]
+
+# The radius of the Earth (in meters) that MongoDB uses when computing spherical distances.
+EARTH_RADIUS_METERS = 6378100.0
+
+# The width and height (in degrees) of the cells of the grid by which the index is organized.
+CELL_SIZE = 1.0
+NUM_ROWS = int(180 / CELL_SIZE)
+NUM_COLUMNS = int(360 / CELL_SIZE)
+
+
+def is_available() -> bool:
+    r"""Returns `True` if the dependencies of the spatial index are installed."""
+    return np is not None
+
+
+class SpatialIndex:
+    r"""
+    An immutable, in-memory index of the locations of a set of entities.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        longitudes: Sequence[float],
+        latitudes: Sequence[float],
+    ) -> None:
+        if np is None:
+            raise RuntimeError(
+                "The spatial index requires NumPy; install the `spatial` extra"
+            )
+        longitudes_array = np.asarray(longitudes, dtype=np.float64)
+        latitudes_array = np.asarray(latitudes, dtype=np.float64)
+        keys = cell_row(latitudes_array) * NUM_COLUMNS + cell_column(longitudes_array)
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.longitudes = longitudes_array[order]
+        self.latitudes = latitudes_array[order]
+        self.ids = np.asarray(ids, dtype=object)[order]
+        # The position of each entity's `id` in the sorted list of all of the `id`s, which we
+        # use to sort entities by `id` (without comparing strings).
+        self.id_ranks = np.empty(len(self.ids), dtype=np.int64)
+        self.id_ranks[np.argsort(self.ids)] = np.arange(len(self.ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def within_bbox(self, bbox: BoundingBox) -> List[str]:
+        r"""
+        Returns the `id`s (in sorted order) of the entities located within the bounding box.
+        A bounding box whose west longitude is greater than its east longitude crosses the
+        antimeridian.
+        """
+        west, south, east, north = bbox
+        positions = self._candidates(west, south, east, north)
+        longitudes = self.longitudes[positions]
+        latitudes = self.latitudes[positions]
+        if west <= east:
+            in_longitude = (west <= longitudes) & (longitudes <= east)
+        else:
+            in_longitude = (west <= longitudes) | (longitudes <= east)
+        positions = positions[
+            in_longitude & (south <= latitudes) & (latitudes <= north)
+        ]
+        positions = positions[np.argsort(self.id_ranks[positions])]
+        return self.ids[positions].tolist()
+
+    def nearby(
+        self, longitude: float, latitude: float, radius_meters: float
+    ) -> Tuple[List[str], List[float]]:
+        r"""
+        Returns the `id`s of the entities located within the radius (in meters) of the point,
+        and their distances (in meters) from the point; sorted by distance, then by `id`.
+        """
+        angular_radius = math.degrees(radius_meters / EARTH_RADIUS_METERS)
+        south = latitude - angular_radius
+        north = latitude + angular_radius
+        # Determine the range of longitudes the circle spans.
+        # Reference: http://janmatuschek.de/LatitudeLongitudeBoundingCoordinates
+        sin_delta = 2.0  # i.e. the circle contains a pole, so it spans all longitudes
+        if south > -90 and north < 90:
+            sin_delta = math.sin(math.radians(angular_radius)) / math.cos(
+                math.radians(latitude)
+            )
+        if sin_delta >= 1:
+            west, east = -180.0, 180.0
+        else:
+            delta = math.degrees(math.asin(sin_delta))
+            west, east = longitude - delta, longitude + delta
+            if west < -180:
+                west += 360
+            if east > 180:
+                east -= 360
+
+        positions = self._candidates(west, max(south, -90), east, min(north, 90))
+        distances = haversine_distances(
+            longitude, latitude, self.longitudes[positions], self.latitudes[positions]
+        )
+        is_within_radius = distances <= radius_meters
+        positions, distances = positions[is_within_radius], distances[is_within_radius]
+        order = np.lexsort((self.id_ranks[positions], distances))
+        return self.ids[positions[order]].tolist(), distances[order].tolist()
+
+    def _candidates(
+        self, west: float, south: float, east: float, north: float
+    ) -> "np.ndarray":
+        r"""Returns the positions of the entities in the grid cells overlapping the bounding box."""
+        column_ranges = (
+            [(cell_column(west), cell_column(east))]
+            if west <= east
+            else [(cell_column(west), NUM_COLUMNS - 1), (0, cell_column(east))]
+        )
+        row_keys = np.arange(cell_row(south), cell_row(north) + 1) * NUM_COLUMNS
+        ranges = []
+        for first_column, last_column in column_ranges:
+            starts = np.searchsorted(self.keys, row_keys + first_column, side="left")
+            ends = np.searchsorted(self.keys, row_keys + last_column, side="right")
+            ranges.extend(zip(starts.tolist(), ends.tolist()))
+        positions = [np.arange(start, end) for start, end in ranges if end > start]
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(positions)
+
+
+class SpatialIndexReplica:
+    r"""
+    Keeps an in-memory `SpatialIndex` of the entities in a collection up to date with the
+    collection's ingest generation (i.e. the version of its data).
+
+    When the generation changes, the first request to notice builds a new index and then
+    replaces the old one with it; requests made in the meantime keep using the old index, so
+    each request uses either the old index or the new one in its entirety.
+    """
+
+    def __init__(self) -> None:
+        self._index: Optional[SpatialIndex] = None
+        self._generation: Optional[Hashable] = None
+        self._lock = asyncio.Lock()
+
+    async def get(
+        self, collection: AsyncCollection, generation: Hashable
+    ) -> SpatialIndex:
+        r"""
+        Returns an index of the specified generation of the data (or of the previous
+        generation, while the index of the specified one is being built).
+        """
+        if self._index is not None and (
+            self._generation == generation or self._lock.locked()
+        ):
+            return self._index
+        async with self._lock:
+            if self._index is None or self._generation != generation:
+                self._index = await load_spatial_index(collection)
+                self._generation = generation
+            return self._index
+
+
+async def load_spatial_index(collection: AsyncCollection) -> SpatialIndex:
+    r"""Builds an index of the locations of the entities in the collection."""
+    ids: List[str] = []
+    longitudes: List[float] = []
+    latitudes: List[float] = []
+    cursor = collection.find(
+        {"geojson.type": "Point"},
+        projection={"_id": 0, "id": 1, "geojson.coordinates": 1},
+    )
+    async for document in cursor.batch_size(10_000):
+        longitude, latitude = document["geojson"]["coordinates"][:2]
+        ids.append(document["id"])
+        longitudes.append(longitude)
+        latitudes.append(latitude)
+
+    # Note: We build the index in a worker thread, so we don't block the event loop.
+    return await asyncio.to_thread(SpatialIndex, ids, longitudes, latitudes)
+
+
+def cell_row(latitude: Any) -> Any:
+    r"""Returns the row(s) of the grid cell(s) containing the latitude(s)."""
+    if np is not None and isinstance(latitude, np.ndarray):
+        rows = np.floor((latitude + 90) / CELL_SIZE).astype(np.int64)
+        return np.clip(rows, 0, NUM_ROWS - 1)
+    return min(max(int(math.floor((latitude + 90) / CELL_SIZE)), 0), NUM_ROWS - 1)
+
+
+def cell_column(longitude: Any) -> Any:
+    r"""Returns the column(s) of the grid cell(s) containing the longitude(s)."""
+    if np is not None and isinstance(longitude, np.ndarray):
+        columns = np.floor((longitude + 180) / CELL_SIZE).astype(np.int64)
+        return np.clip(columns, 0, NUM_COLUMNS - 1)
+    return min(max(int(math.floor((longitude + 180) / CELL_SIZE)), 0), NUM_COLUMNS - 1)
+
+
+def haversine_distances(
+    longitude: float,
+    latitude: float,
+    longitudes: "np.ndarray",
+    latitudes: "np.ndarray",
+) -> "np.ndarray":
+    r"""Returns the great-circle distances (in meters) from the point to each of the points."""
+    latitude_1, latitudes_2 = np.radians(latitude), np.radians(latitudes)
+    half_delta_latitude = (latitudes_2 - latitude_1) / 2
+    half_delta_longitude = np.radians(longitudes - longitude) / 2
+    a = (
+        np.sin(half_delta_latitude) ** 2
+        + np.cos(latitude_1) * np.cos(latitudes_2) * np.sin(half_delta_longitude) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
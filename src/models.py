@@ -1,9 +1,12 @@
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Literal, Optional, List, Union
 
 from pydantic import BaseModel, ConfigDict, Field
 
 from schema.datamodel.bertron_schema_pydantic import Entity
 
+# The (indexed) fields by whose values the API can count the entities matching a query.
+FacetFieldName = Literal["ber_data_source", "data_type", "entity_type"]
+
 
 class MongoFindQueryDescriptor(BaseModel):
     r"""
@@ -36,6 +39,24 @@ class MongoFindQueryDescriptor(BaseModel):
         default=None,
         description="Sort criteria (1 for ascending, -1 for descending)",
     )
+    after: Optional[str] = Field(
+        default=None,
+        description=(
+            "Continuation token (the `next` value of the previous page's response) "
+            "identifying where the requested page starts"
+        ),
+    )
+    include_total: bool = Field(
+        default=False,
+        description="Whether to include the total number of matching documents in the response",
+    )
+    facets: Optional[List[FacetFieldName]] = Field(
+        default=None,
+        description=(
+            "Fields by whose values to count the matching documents "
+            "(the counts are included in the response)"
+        ),
+    )
 
 
 class EntitiesResponse(BaseModel):
@@ -51,6 +72,30 @@ class EntitiesResponse(BaseModel):
         title="Entity count",
         description="Total number of entities returned",
     )
+    next: Optional[str] = Field(
+        default=None,
+        title="Continuation token",
+        description=(
+            "Token that can be passed as `after` to get the next page, "
+            "or `null` if there are no more pages"
+        ),
+    )
+    total: Optional[int] = Field(
+        default=None,
+        title="Total count",
+        description=(
+            "Total number of documents matching the query (across all pages), "
+            "if it was requested"
+        ),
+    )
+    facets: Optional[Dict[str, Dict[str, int]]] = Field(
+        default=None,
+        title="Facet counts",
+        description=(
+            "For each requested field, the number of matching documents having each value "
+            "of that field, if they were requested"
+        ),
+    )
 
 
 class FindResponse(BaseModel):
@@ -66,6 +111,237 @@ class FindResponse(BaseModel):
         title="Document count",
         description="Total number of documents returned",
     )
+    next: Optional[str] = Field(
+        default=None,
+        title="Continuation token",
+        description=(
+            "Token that can be passed as `after` to get the next page, "
+            "or `null` if there are no more pages"
+        ),
+    )
+    total: Optional[int] = Field(
+        default=None,
+        title="Total count",
+        description=(
+            "Total number of documents matching the query (across all pages), "
+            "if it was requested"
+        ),
+    )
+    facets: Optional[Dict[str, Dict[str, int]]] = Field(
+        default=None,
+        title="Facet counts",
+        description=(
+            "For each requested field, the number of matching documents having each value "
+            "of that field, if they were requested"
+        ),
+    )
+
+
+class GeoJSONPolygon(BaseModel):
+    r"""
+    A GeoJSON polygon; i.e. a list of linear rings (the first of which is the exterior ring),
+    each of which is a closed list of `[longitude, latitude]` positions.
+
+    Reference: https://datatracker.ietf.org/doc/html/rfc7946#section-3.1.6
+    """
+
+    type: Literal["Polygon"]
+    coordinates: List[List[List[float]]]
+
+
+class GeoJSONMultiPolygon(BaseModel):
+    r"""
+    A GeoJSON multipolygon; i.e. a list of polygons' coordinates.
+
+    Reference: https://datatracker.ietf.org/doc/html/rfc7946#section-3.1.7
+    """
+
+    type: Literal["MultiPolygon"]
+    coordinates: List[List[List[List[float]]]]
+
+
+class GeoWithinQuery(BaseModel):
+    r"""A query for the entities located within a GeoJSON polygon or multipolygon."""
+
+    geometry: Union[GeoJSONPolygon, GeoJSONMultiPolygon] = Field(
+        ...,
+        discriminator="type",
+        description="The polygon or multipolygon within which to find entities",
+    )
+    limit: int = Field(
+        default=100,
+        ge=1,
+        le=1000,
+        description="Maximum number of entities per page",
+    )
+    after: Optional[str] = Field(
+        default=None,
+        description="Continuation token (the `next` value of the previous page's response)",
+    )
+
+
+class NearbyEntitiesResponse(EntitiesResponse):
+    r"""A response containing a list of entities, their distances from a point, and count."""
+
+    distances: List[float] = Field(
+        ...,
+        title="Distances",
+        description="Distance (in meters) of each entity from the point, in the same order",
+    )
+
+
+class NearbyFindResponse(FindResponse):
+    r"""A response containing a list of dicts, their distances from a point, and count."""
+
+    distances: List[float] = Field(
+        ...,
+        title="Distances",
+        description="Distance (in meters) of each document from the point, in the same order",
+    )
+
+
+class NearbyPoint(BaseModel):
+    r"""A point near which to find entities, as part of a `BatchNearbyRequest`."""
+
+    latitude: float = Field(..., ge=-90, le=90, description="Latitude in degrees")
+    longitude: float = Field(..., ge=-180, le=180, description="Longitude in degrees")
+    radius_meters: float = Field(..., gt=0, description="Search radius in meters")
+    limit: int = Field(
+        default=100,
+        ge=1,
+        le=1000,
+        description="Maximum number of entities to find near the point (the closest ones)",
+    )
+
+
+class BatchNearbyRequest(BaseModel):
+    r"""A request for the entities located near each of several points."""
+
+    points: List[NearbyPoint] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Points near which to find entities",
+    )
+
+
+class NearbyHits(BaseModel):
+    r"""The entities found near one of the points of a `BatchNearbyRequest`."""
+
+    ids: List[str] = Field(
+        ...,
+        title="Entity IDs",
+        description="IDs of the entities located near the point, closest first",
+    )
+    distances: List[float] = Field(
+        ...,
+        title="Distances",
+        description="Distance (in meters) of each entity from the point, in the same order",
+    )
+
+
+class BatchNearbyResponse(BaseModel):
+    r"""
+    A response containing the entities located near each of several points. Each entity is
+    included in `documents` once, even if it is located near several of the points.
+    """
+
+    documents: List[Entity] = Field(
+        ...,
+        title="Entity documents",
+        description="List of the entities located near any of the points",
+    )
+    count: int = Field(
+        ...,
+        title="Entity count",
+        description="Total number of entities returned",
+    )
+    results: List[NearbyHits] = Field(
+        ...,
+        title="Results",
+        description="The entities located near each point, in the order the points were specified",
+    )
+
+
+class BatchLookupRequest(BaseModel):
+    r"""A request for the entities having the specified IDs."""
+
+    ids: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="IDs of the entities to get",
+    )
+
+
+class BatchLookupResponse(BaseModel):
+    r"""A response containing the entities having the requested IDs, and the IDs no entity has."""
+
+    documents: List[Entity] = Field(
+        ...,
+        title="Entity documents",
+        description="List of entities having the requested IDs, in the order requested",
+    )
+    count: int = Field(
+        ...,
+        title="Entity count",
+        description="Total number of entities returned",
+    )
+    missing: List[str] = Field(
+        ...,
+        title="Missing IDs",
+        description="List of requested IDs that no entity has",
+    )
+
+
+class Cluster(BaseModel):
+    r"""A group of entities located within the same cell of a grid."""
+
+    latitude: float = Field(
+        ...,
+        title="Latitude",
+        description="Latitude of the centroid of the entities in the cluster",
+    )
+    longitude: float = Field(
+        ...,
+        title="Longitude",
+        description="Longitude of the centroid of the entities in the cluster",
+    )
+    count: int = Field(
+        ...,
+        title="Entity count",
+        description="Number of entities in the cluster",
+    )
+    ber_data_sources: Dict[str, int] = Field(
+        ...,
+        title="Entity counts by BER data source",
+        description="Number of entities in the cluster from each BER data source",
+    )
+
+
+class ClustersResponse(BaseModel):
+    r"""A response containing clusters of entities and counts."""
+
+    clusters: List[Cluster] = Field(
+        ...,
+        title="Clusters",
+        description="List of clusters, largest first",
+    )
+    count: int = Field(
+        ...,
+        title="Cluster count",
+        description="Total number of clusters returned",
+    )
+    total: int = Field(
+        ...,
+        title="Entity count",
+        description="Total number of entities in the clusters",
+    )
+    cell_size: float = Field(
+        ...,
+        title="Cell size",
+        description="Width and height (in degrees) of the grid cells the entities were grouped by",
+    )
 
 
 class HealthResponse(BaseModel):
@@ -103,3 +379,45 @@ class VersionResponse(BaseModel):
         title="BERtron schema version",
         description="The version identifier of the BERtron schema",
     )
+
+
+class CacheStatsResponse(BaseModel):
+    r"""A response containing statistics about the query result cache."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    hits: int = Field(
+        ...,
+        title="Hits",
+        description="Number of queries answered using a cached response",
+    )
+    misses: int = Field(
+        ...,
+        title="Misses",
+        description="Number of queries for which there was no cached response",
+    )
+    entries: int = Field(
+        ...,
+        title="Entries",
+        description="Number of responses currently in the cache",
+    )
+    size_bytes: int = Field(
+        ...,
+        title="Size",
+        description="Total size (in bytes) of the responses currently in the cache",
+    )
+    max_bytes: int = Field(
+        ...,
+        title="Maximum size",
+        description="Maximum total size (in bytes) of the responses in the cache",
+    )
+    evictions: int = Field(
+        ...,
+        title="Evictions",
+        description="Number of responses discarded to make room for other responses",
+    )
+    invalidations: int = Field(
+        ...,
+        title="Invalidations",
+        description="Number of times the cache was emptied because the data changed",
+    )
@@ -1,35 +1,267 @@
+import asyncio
+import bisect
+import gzip
+import itertools
+import json
 import logging
-from typing import Optional, Dict, Any, Union
+import math
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from types import UnionType
+from typing import (
+    Awaitable,
+    Callable,
+    Optional,
+    Dict,
+    Sequence,
+    Any,
+    AsyncIterator,
+    List,
+    Tuple,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+)
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import RedirectResponse
-from pymongo import MongoClient
+from fastapi import FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.cursor import AsyncCursor
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import ExecutionTimeout, PyMongoError
+from pydantic import BaseModel
 from scalar_fastapi import get_scalar_api_reference
 from schema.datamodel.bertron_schema_pydantic import Entity
 import uvicorn
 
 from config import settings as cfg
+from lib.cache import ResponseCache, canonical_key
+from lib.geo import MAX_ZOOM, bbox_filter, grid_cell_size, parse_bbox
+from lib.generation import IngestGeneration, IngestGenerationTracker
+from lib.guardrails import (
+    disallowed_operators,
+    disallowed_projection_fields,
+    is_collection_scan,
+)
 from lib.helpers import get_package_version
+from lib.mvt import (
+    DEFAULT_EXTENT,
+    MVT_MEDIA_TYPE,
+    PointFeature,
+    encode_point_layer,
+    project_to_tile,
+    tile_bounds,
+)
+from lib.pagination import (
+    decode_distance_token,
+    decode_token,
+    encode_distance_token,
+    encode_token,
+    get_path,
+    is_inclusion_projection,
+    keyset_filter,
+    keyset_sort,
+    pop_path,
+    projection_with_keys,
+)
+from lib.points import POINTS_MEDIA_TYPE, Point, encode_points
+from lib.registry import CollectionRegistry
+from lib.spatial import SpatialIndex, SpatialIndexReplica
+from lib import spatial
 from models import (
+    BatchLookupRequest,
+    BatchLookupResponse,
+    BatchNearbyRequest,
+    BatchNearbyResponse,
+    CacheStatsResponse,
+    Cluster,
+    ClustersResponse,
     EntitiesResponse,
     FindResponse,
+    GeoWithinQuery,
     HealthResponse,
     MongoFindQueryDescriptor,
+    NearbyEntitiesResponse,
+    NearbyFindResponse,
+    NearbyHits,
+    NearbyPoint,
     VersionResponse,
 )
 
 
+# The name of the layer of the vector tiles in which entities are located.
+TILE_LAYER_NAME = "entities"
+
+# The width (in tile coordinates) of the margin around each vector tile, within which we
+# include points located in adjacent tiles; so that map clients can render the symbols of
+# points near the edges of tiles without cutting them off.
+TILE_BUFFER = 64
+
+# The maximum number of `id`s we look up documents by in a single query.
+ID_LOOKUP_BATCH_SIZE = 10_000
+
+# The maximum number of searches of a batch nearby search that we run at the same time.
+NEARBY_BATCH_CONCURRENCY = 16
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Connect to the MongoDB server.
-mongo_client = MongoClient(
-    f"{cfg.mongo_host}:{cfg.mongo_port}",
-    username=cfg.mongo_username,
-    password=cfg.mongo_password,
+# Media type of newline-delimited JSON (one JSON document per line).
+# Reference: https://github.com/ndjson/ndjson-spec
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# The media type of GeoJSON documents.
+# Reference: https://www.rfc-editor.org/rfc/rfc7946#section-12
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+
+# The `Entity` fields that we include (by default) in the properties of GeoJSON features.
+DEFAULT_FEATURE_PROPERTIES = [
+    "id",
+    "name",
+    "description",
+    "ber_data_source",
+    "entity_type",
+    "data_type",
+    "uri",
+]
+
+# The names of the fields that the `Entity` model has.
+ENTITY_FIELD_NAMES = list(Entity.model_fields.keys())
+
+
+def is_list_annotation(annotation: Any) -> bool:
+    r"""Returns `True` if the type annotation is that of a list (or of an optional list)."""
+    if get_origin(annotation) in (Union, UnionType):
+        return any(is_list_annotation(arg) for arg in get_args(annotation))
+    return annotation is list or get_origin(annotation) is list
+
+
+# The names of the `Entity` fields whose values are arrays.
+ARRAY_FIELD_NAMES = [
+    name
+    for name, field in Entity.model_fields.items()
+    if is_list_annotation(field.annotation)
+]
+
+# Fields that the ingest script adds to the documents it stores, which are not part of the
+# `Entity` model (in addition to the `_id` field that MongoDB adds).
+INGEST_FIELD_NAMES = ["_metadata", "geojson", "geohash"]
+
+# A projection that makes MongoDB return only the `Entity` fields of each document; so that
+# the other fields are neither sent over the network nor decoded by the MongoDB driver.
+ENTITY_PROJECTION = {**{name: 1 for name in ENTITY_FIELD_NAMES}, "_id": 0}
+
+# The client we use to talk to the MongoDB server.
+#
+# Note: We create the client when the application starts up (instead of when this module
+#       is imported), since an `AsyncMongoClient` is bound to the event loop on which it
+#       is first used. References:
+#       - https://pymongo.readthedocs.io/en/stable/async-tutorial.html
+#       - https://fastapi.tiangolo.com/advanced/events/#lifespan
+#
+mongo_client: Optional[AsyncMongoClient] = None
+
+# A record of whether the collections we query exist, so we don't have to ask the MongoDB
+# server about them before every query.
+collection_registry = CollectionRegistry(
+    ttl_seconds=cfg.collection_registry_ttl_seconds
+)
+
+# A record of the current ingest generation (i.e. version) of the data.
+generation_tracker = IngestGenerationTracker(
+    ttl_seconds=cfg.ingest_generation_ttl_seconds
+)
+
+# The serialized responses to recent `POST /bertron/find` queries, so that we can answer
+# queries that are made repeatedly (e.g. by dashboards) without querying the database.
+find_cache = ResponseCache(
+    max_bytes=cfg.find_cache_max_bytes, ttl_seconds=cfg.find_cache_ttl_seconds
+)
+
+# An in-memory index of the entities' locations (used when `cfg.spatial_index` is enabled).
+spatial_index_replica = SpatialIndexReplica()
+
+# The vector tiles we have built recently, so we don't have to build them again.
+tile_cache = ResponseCache(
+    max_bytes=cfg.tile_cache_max_bytes, ttl_seconds=cfg.tile_cache_ttl_seconds
 )
 
+# The compressed binary point feed, which we build once per ingest generation; and a lock
+# that makes concurrent requests wait for one of them to build it, instead of each doing so.
+points_cache = ResponseCache(max_bytes=cfg.points_cache_max_bytes, ttl_seconds=math.inf)
+points_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    r"""Connects to the MongoDB server while the application is running."""
+    global mongo_client
+    if cfg.spatial_index and not spatial.is_available():
+        raise RuntimeError(
+            "The spatial index is enabled, but NumPy is not installed; "
+            "install the `spatial` extra or disable the spatial index"
+        )
+    mongo_client = AsyncMongoClient(
+        f"{cfg.mongo_host}:{cfg.mongo_port}",
+        username=cfg.mongo_username,
+        password=cfg.mongo_password,
+    )
+    try:
+        await collection_registry.refresh(get_database(), "entities")
+    except PyMongoError as e:
+        logger.warning(f"Failed to check whether the entities collection exists: {e}")
+    try:
+        yield
+    finally:
+        await mongo_client.close()
+        mongo_client = None
+
+
+def get_database() -> AsyncDatabase:
+    r"""Returns the application's MongoDB database."""
+    assert mongo_client is not None, "Connection to database has not been established"
+    return mongo_client[cfg.mongo_database]
+
+
+async def get_entities_collection() -> AsyncCollection:
+    r"""Returns the entities collection, raising a 404 error if it does not exist."""
+    db = get_database()
+    if not await collection_registry.exists(db, "entities"):
+        raise HTTPException(status_code=404, detail="Entities collection not found")
+    return db["entities"]
+
+
+async def get_spatial_index(collection: AsyncCollection) -> Optional[SpatialIndex]:
+    r"""
+    Returns the in-memory index of the entities' locations, or `None` if it is disabled or
+    we don't know the ingest generation (in which case we couldn't tell when to rebuild it).
+    """
+    if not cfg.spatial_index:
+        return None
+    generation = await get_ingest_generation()
+    if generation is None:
+        return None
+    return await spatial_index_replica.get(collection, generation)
+
+
+async def get_ingest_generation() -> Optional[IngestGeneration]:
+    r"""Returns the current ingest generation, or `None` if it is not known."""
+    try:
+        return await generation_tracker.get(get_database())
+    except PyMongoError as e:
+        logger.warning(f"Failed to look up the ingest generation: {e}")
+        return None
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="BERtron API",
     description=(
         "[View source](https://github.com/ber-data/bertron/blob/main/src/server.py)\n\n"
@@ -39,6 +271,57 @@ app = FastAPI(
 )
 
 
+@app.middleware("http")
+async def handle_conditional_requests(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    r"""
+    Adds `ETag` and `Last-Modified` headers to successful responses to `GET` requests for
+    entities, and responds to conditional `GET` requests for entities that the client already
+    has the current version of with an empty `304 Not Modified` response.
+
+    Since the data only changes when the ingest script runs, we derive both headers from the
+    ingest generation. This allows us to respond to those conditional requests without
+    querying the entities collection at all.
+
+    References:
+    - https://developer.mozilla.org/en-US/docs/Web/HTTP/Guides/Conditional_requests
+    - https://fastapi.tiangolo.com/tutorial/middleware/
+    """
+    if request.method not in ("GET", "HEAD") or not request.url.path.startswith(
+        "/bertron"
+    ):
+        return await call_next(request)
+
+    generation = await get_ingest_generation()
+    if generation is None:
+        return await call_next(request)
+
+    validator_headers = {
+        "ETag": generation.etag(
+            str(request.url.path),
+            str(request.url.query),
+            request.headers.get("accept"),
+            # Note: Some responses (e.g. the binary point feed) are compressed for clients
+            #       that accept compressed responses.
+            request.headers.get("accept-encoding"),
+            # Note: These settings affect the representation of the entities.
+            str(cfg.trusted_reads),
+            cfg.trusted_reads_schema_version,
+        ),
+        "Last-Modified": generation.http_last_modified,
+        "Cache-Control": "no-cache",  # i.e. "revalidate before reusing"
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if is_not_modified(request, validator_headers["ETag"], generation):
+        return Response(status_code=304, headers=validator_headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(validator_headers)
+    return response
+
+
 @app.get("/scalar", include_in_schema=False)
 async def get_scalar_html():
     r"""
@@ -59,9 +342,10 @@ def get_root():
 
 
 @app.get("/health")
-def get_health() -> HealthResponse:
+async def get_health() -> HealthResponse:
     r"""Get system health information."""
-    is_database_healthy = len(mongo_client.list_database_names()) > 0
+    assert mongo_client is not None, "Connection to database has not been established"
+    is_database_healthy = len(await mongo_client.list_database_names()) > 0
     return HealthResponse(
         web_server=True,
         database=is_database_healthy,
@@ -79,28 +363,90 @@ def get_version() -> VersionResponse:
     )
 
 
+@app.get("/cache")
+def get_cache_stats() -> CacheStatsResponse:
+    r"""Get statistics about the cache of `POST /bertron/find` responses."""
+    return CacheStatsResponse(**find_cache.stats())
+
+
 @app.get("/bertron")
-def get_all_entities() -> EntitiesResponse:
-    r"""Get all documents from the entities collection."""
-    db = mongo_client[cfg.mongo_database]
+async def get_all_entities(
+    request: Request,
+    stream: bool = Query(
+        False,
+        description=(
+            "Stream the entities to the client as they are read from the database. "
+            f"Clients can also opt into streaming by sending `Accept: {NDJSON_MEDIA_TYPE}`, "
+            "in which case the response will contain one entity per line."
+        ),
+    ),
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        le=1000,
+        description="Maximum number of entities to return (omit to get all of them)",
+    ),
+    after: Optional[str] = Query(
+        None,
+        description="Continuation token (the `next` value of the previous page's response)",
+    ),
+) -> EntitiesResponse:
+    r"""Get all documents from the entities collection.
 
-    # Check if the collection exists
-    if "entities" not in db.list_collection_names():
-        raise HTTPException(status_code=404, detail="Entities collection not found")
+    By default, the whole response is built in memory before it is sent. When streaming is
+    requested, the entities are sent in batches as they are read from the database, so the
+    server's memory usage does not grow with the size of the collection.
 
-    collection = db["entities"]
-    documents = list(collection.find({}))
+    When `limit` is specified, the entities are returned in pages (sorted by `id`), and
+    each page's `next` token can be passed as `after` to get the following page.
 
-    # Convert documents to Entity objects
-    entities = []
-    for doc in documents:
-        entities.append(Entity(**clean_document(doc)))
+    Example: /bertron?stream=true
+    Example: /bertron?limit=100
+    """
+    collection = await get_entities_collection()
 
-    return EntitiesResponse(documents=entities, count=len(entities))
+    is_paginated = limit is not None or after is not None
+    is_streamed = stream or accepts_ndjson(request)
+    if is_paginated and is_streamed:
+        raise HTTPException(
+            status_code=400,
+            detail="Pagination (`limit` and `after`) is not supported when streaming",
+        )
+
+    if is_paginated:
+        try:
+            documents, next_token = await find_page(
+                collection,
+                filter={},
+                projection=entity_projection(),
+                limit=limit,
+                after=after,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return entities_response(documents, next=next_token)
+
+    if accepts_ndjson(request):
+        cursor = collection.find({}, projection=entity_projection())
+        cursor = cursor.batch_size(cfg.stream_batch_size)
+        return StreamingResponse(
+            iter_entities_as_ndjson(cursor), media_type=NDJSON_MEDIA_TYPE
+        )
+    if stream:
+        cursor = collection.find({}, projection=entity_projection())
+        cursor = cursor.batch_size(cfg.stream_batch_size)
+        return StreamingResponse(
+            iter_entities_as_json(cursor), media_type="application/json"
+        )
+
+    documents = await collection.find({}, projection=entity_projection()).to_list()
+
+    # Convert documents to Entity objects
+    return entities_response(documents)
 
 
 @app.post("/bertron/find")
-def find_entities(
+async def find_entities(
     query: MongoFindQueryDescriptor,
 ) -> Union[EntitiesResponse, FindResponse]:
     r"""Execute a MongoDB find operation on the entities collection with filter, projection, skip, limit, and sort options.
@@ -108,63 +454,182 @@ def find_entities(
     Returns EntitiesResponse (validated Entity objects) when no projection is specified,
     or FindResponse (raw documents) when projection is used.
 
+    When there are more matching documents than the limit, the response's `next` token can be
+    passed as `after` (along with the same filter and sort) to get the next page. Unlike `skip`,
+    the cost of fetching a page this way does not grow with the number of pages before it.
+    Pages are sorted by `id` by default, which MongoDB reads via an index (also when filtering
+    on `ber_data_source`, `data_type`, or `entity_type`); other sorts make MongoDB sort the
+    matching documents for each page, and fields whose values are arrays (e.g. `entity_type`)
+    cannot be used to sort pages.
+
+    When `include_total` is true, the response's `total` is the number of documents matching the
+    filter (across all pages). When `facets` lists any fields, the response's `facets` contain,
+    for each of those fields, the number of matching documents having each value of it.
+
+    Responses are cached until the data changes, so repeated queries are answered without
+    querying the database. The `X-Cache` response header says whether the response was
+    cached (`HIT`) or not (`MISS`).
+
     Example query body:
     {
         "filter": {"field": "value", "number_field": {"$gt": 100}},
         "projection": {"field1": 1, "field2": 1},
         "skip": 0,
         "limit": 100,
-        "sort": {"field1": 1, "field2": -1}
+        "sort": {"field1": 1, "field2": -1},
+        "after": null,
+        "include_total": false,
+        "facets": ["ber_data_source", "entity_type"]
     }
     """
-    db = mongo_client[cfg.mongo_database]
+    collection = await get_entities_collection()
 
-    # Check if the collection exists
-    if "entities" not in db.list_collection_names():
-        raise HTTPException(status_code=404, detail="Entities collection not found")
+    # Reject filters that use operators (and projections that use expressions) that could
+    # make MongoDB run arbitrary code or read every document.
+    operators = disallowed_operators(query.filter)
+    if len(operators) > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                "Query error: The filter uses operators that are not allowed: "
+                + ", ".join(operators)
+            ),
+        )
+    fields = disallowed_projection_fields(query.projection or {})
+    if len(fields) > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                "Query error: The projection's values must be 0 or 1 (or true or false), "
+                "but are not for: " + ", ".join(fields)
+            ),
+        )
 
-    collection = db["entities"]
+    # Answer the query with a cached response if we answered it since the data last changed.
+    # Note: If we don't know the ingest generation, we can't tell when the data changes; so
+    #       we don't use the cache.
+    generation = await get_ingest_generation()
+    cache_key = canonical_key(
+        query.filter,
+        query.projection,
+        query.sort,
+        query.skip or 0,
+        query.limit,
+        query.after,
+        query.include_total,
+        query.facets,
+        # Note: These settings affect the representation of the entities.
+        cfg.trusted_reads,
+        cfg.trusted_reads_schema_version,
+    )
+    if generation is not None:
+        content = find_cache.get(cache_key, generation)
+        if content is not None:
+            return cached_response(content, is_hit=True)
 
     try:
-        # Execute find with query parameters
-        cursor = collection.find(filter=query.filter, projection=query.projection)
-
-        # Apply skip, limit, and sort if provided
-        if query.sort:
-            cursor = cursor.sort(list(query.sort.items()))
-        if query.skip:
-            cursor = cursor.skip(query.skip)
-        if query.limit:
-            cursor = cursor.limit(query.limit)
+        max_time_ms = await query_time_limit(
+            collection,
+            query.filter,
+            query.sort,
+            is_paginated=query.limit is not None or query.after is not None,
+        )
 
-        # Convert cursor to list
-        documents = list(cursor)
+        # Execute find with query parameters, using the continuation token (if any)
+        # to pick up where the previous page left off.
+        documents, next_token = await find_page(
+            collection,
+            filter=query.filter,
+            projection=entity_projection(query.projection),
+            sort=query.sort,
+            skip=query.skip or 0,
+            limit=query.limit,
+            after=query.after,
+            max_time_ms=max_time_ms,
+        )
+        total, facets = await count_matches(
+            collection,
+            filter=query.filter,
+            include_total=query.include_total,
+            facet_fields=query.facets or [],
+            max_time_ms=max_time_ms,
+        )
 
         # Return different response types based on whether projection is used
         if query.projection:
             # When projection is used, return raw documents as FindResponse
-            # Remove MongoDB internal fields
-            cleaned_documents = []
-            for doc in documents:
-                cleaned_documents.append(clean_document(doc))
-
-            return FindResponse(
-                documents=cleaned_documents, count=len(cleaned_documents)
+            # Note: An inclusion projection has already been narrowed down to `Entity`
+            #       fields by MongoDB; but an exclusion projection may let through other
+            #       fields than the ones we know of, so we clean those documents here.
+            cleaned_documents = documents
+            if not is_inclusion_projection(query.projection):
+                cleaned_documents = [clean_document(doc) for doc in documents]
+
+            response = FindResponse(
+                documents=cleaned_documents,
+                count=len(cleaned_documents),
+                next=next_token,
+                total=total,
+                facets=facets,
             )
         else:
             # When no projection, return validated Entity objects as EntitiesResponse
-            entities = []
-            for doc in documents:
-                entities.append(Entity(**clean_document(doc)))
+            response = entities_response(
+                documents, next=next_token, total=total, facets=facets
+            )
 
-            return EntitiesResponse(documents=entities, count=len(entities))
+        content = render_json(response)
 
+    except ExecutionTimeout:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Query error: The query took longer than {max_time_ms} ms; "
+                "try filtering on indexed fields (e.g. `id` or `ber_data_source`)"
+            ),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
+
+    if generation is not None:
+        find_cache.put(cache_key, generation, content)
+    return cached_response(content, is_hit=False)
+
+
+@app.post("/bertron/batch")
+async def get_entities_by_ids(request: BatchLookupRequest) -> BatchLookupResponse:
+    r"""Get multiple entities by their IDs, using a single query.
+
+    The entities are returned in the order in which their IDs were specified (once each,
+    even if an ID was specified more than once), and the IDs that no entity has are
+    listed in `missing`.
+
+    Example query body:
+    {
+        "ids": ["EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488", "nmdc:bsm-11-bsf8yq62"]
+    }
+    """
+    collection = await get_entities_collection()
+
+    # Note: `dict.fromkeys` discards duplicate IDs while preserving the order of the others.
+    ids = list(dict.fromkeys(request.ids))
+
+    try:
+        documents_by_id = await find_documents_by_id(
+            collection, ids, projection=entity_projection()
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
 
+    return entities_response(
+        [documents_by_id[id] for id in ids if id in documents_by_id],
+        model=BatchLookupResponse,
+        missing=[id for id in ids if id not in documents_by_id],
+    )
+
 
 @app.get("/bertron/geo/nearby")
-def find_nearby_entities(
+async def find_nearby_entities(
     latitude: float = Query(
         ..., ge=-90, le=90, description="Center latitude in degrees"
     ),
@@ -172,56 +637,131 @@ def find_nearby_entities(
         ..., ge=-180, le=180, description="Center longitude in degrees"
     ),
     radius_meters: float = Query(..., gt=0, description="Search radius in meters"),
-) -> EntitiesResponse:
-    r"""Find entities within a specified radius of a geographic point using MongoDB's $near operator.
+    limit: int = Query(
+        100,
+        ge=1,
+        le=1000,
+        description="Maximum number of entities per page",
+    ),
+    after: Optional[str] = Query(
+        None,
+        description="Continuation token (the `next` value of the previous page's response)",
+    ),
+    max_results: Optional[int] = Query(
+        None,
+        ge=1,
+        description="Maximum number of entities to return in total (across all pages)",
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated names of the fields to include in each document",
+    ),
+) -> Union[NearbyEntitiesResponse, NearbyFindResponse]:
+    r"""Find entities within a specified radius of a geographic point, closest first.
+
+    This endpoint uses MongoDB's `$geoNear` aggregation stage, which uses the 2dsphere index
+    on the `geojson` field to read the entities in order of their distance from the point;
+    so MongoDB only reads as many entities as are returned. The response's `distances`
+    contain the distance (in meters) of each entity from the point.
 
-    This endpoint uses MongoDB's geospatial $near query which requires a 2dsphere index
-    on the coordinates field for optimal performance.
+    The entities are returned in pages of (at most) `limit` entities, and each page's `next`
+    token can be passed as `after` (along with the same point and radius) to get the
+    following page. When `fields` is specified, the response contains only those fields
+    of each entity.
 
     Example: /bertron/geo/nearby?latitude=47.6062&longitude=-122.3321&radius_meters=10000
+    Example: /bertron/geo/nearby?latitude=34&longitude=118&radius_meters=1e6&limit=20&fields=id,name
     """
-    db = mongo_client[cfg.mongo_database]
+    collection = await get_entities_collection()
 
-    # Check if the collection exists
-    if "entities" not in db.list_collection_names():
-        raise HTTPException(status_code=404, detail="Entities collection not found")
+    try:
+        projection = None
+        if fields is not None:
+            projection = {name.strip(): 1 for name in fields.split(",")}
+
+        documents, distances, next_token = await find_nearby_page(
+            collection,
+            longitude=longitude,
+            latitude=latitude,
+            radius_meters=radius_meters,
+            projection=entity_projection(projection),
+            limit=limit,
+            after=after,
+            max_results=max_results,
+        )
+        if projection is not None:
+            return NearbyFindResponse(
+                documents=documents,
+                count=len(documents),
+                next=next_token,
+                distances=distances,
+            )
+        return entities_response(
+            documents,
+            model=NearbyEntitiesResponse,
+            next=next_token,
+            distances=distances,
+        )
 
-    collection = db["entities"]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Nearby query error: {str(e)}")
 
-    try:
-        # Build the $near geospatial query
-        geo_filter = {
-            "geojson": {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [
-                            longitude,
-                            latitude,
-                        ],  # MongoDB uses [lng, lat] format
-                    },
-                    "$maxDistance": radius_meters,
-                }
-            }
-        }
 
-        # Execute find with geospatial filter
-        cursor = collection.find(filter=geo_filter)
+@app.post("/bertron/geo/nearby/batch")
+async def find_nearby_entities_batch(
+    request: BatchNearbyRequest,
+) -> BatchNearbyResponse:
+    r"""Find the entities located near each of several points, closest first.
 
-        # Convert cursor to list and convert to Entity objects
-        documents = list(cursor)
-        entities = []
-        for doc in documents:
-            entities.append(Entity(**clean_document(doc)))
+    The searches run concurrently (each using the 2dsphere index, like `/bertron/geo/nearby`)
+    and return only the `id`s of the entities they find; then the entities are fetched once
+    each, even if they are located near several of the points. The response's `results`
+    contain the `id`s and distances of the entities found near each point, in the order the
+    points were specified; and its `documents` contain each of those entities once.
+
+    Example query body:
+    {
+        "points": [
+            {"latitude": 34, "longitude": 118, "radius_meters": 100000, "limit": 10},
+            {"latitude": 65, "longitude": -164.5, "radius_meters": 50000}
+        ]
+    }
+    """
+    collection = await get_entities_collection()
+    semaphore = asyncio.Semaphore(NEARBY_BATCH_CONCURRENCY)
+
+    async def find_hits(point: NearbyPoint) -> NearbyHits:
+        async with semaphore:
+            documents, distances, _ = await find_nearby_page(
+                collection,
+                longitude=point.longitude,
+                latitude=point.latitude,
+                radius_meters=point.radius_meters,
+                projection={"_id": 0, "id": 1},
+                max_results=point.limit,
+            )
+        return NearbyHits(ids=[doc["id"] for doc in documents], distances=distances)
 
-        return EntitiesResponse(documents=entities, count=len(entities))
+    try:
+        results = await asyncio.gather(*(find_hits(point) for point in request.points))
 
+        # Note: `dict.fromkeys` discards duplicate IDs while preserving the order of the others.
+        ids = list(dict.fromkeys(id for hits in results for id in hits.ids))
+        documents_by_id = await find_documents_by_id(
+            collection, ids, projection=entity_projection()
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Nearby query error: {str(e)}")
 
+    return entities_response(
+        [documents_by_id[id] for id in ids if id in documents_by_id],
+        model=BatchNearbyResponse,
+        results=results,
+    )
+
 
 @app.get("/bertron/geo/bbox")
-def find_entities_in_bounding_box(
+async def find_entities_in_bounding_box(
     southwest_lat: float = Query(
         ..., ge=-90, le=90, description="Southwest corner latitude"
     ),
@@ -238,17 +778,14 @@ def find_entities_in_bounding_box(
     r"""Find entities within a bounding box using MongoDB's $geoWithin operator.
 
     This endpoint finds all entities whose coordinates fall within the specified
-    rectangular bounding box defined by southwest and northeast corners.
+    rectangular bounding box defined by southwest and northeast corners. If the
+    southwest corner's longitude is greater than the northeast corner's, the
+    bounding box crosses the antimeridian (i.e. 180 degrees longitude).
 
     Example: /bertron/geo/bbox?southwest_lat=47.5&southwest_lng=-122.4&northeast_lat=47.7&northeast_lng=-122.2
+    Example: /bertron/geo/bbox?southwest_lat=-20&southwest_lng=170&northeast_lat=-10&northeast_lng=-170
     """
-    db = mongo_client[cfg.mongo_database]
-
-    # Check if the collection exists
-    if "entities" not in db.list_collection_names():
-        raise HTTPException(status_code=404, detail="Entities collection not found")
-
-    collection = db["entities"]
+    collection = await get_entities_collection()
 
     try:
         # Validate bounding box coordinates
@@ -257,37 +794,35 @@ def find_entities_in_bounding_box(
                 status_code=400,
                 detail="Southwest latitude must be less than northeast latitude",
             )
-        if southwest_lng >= northeast_lng:
+        if southwest_lng == northeast_lng:
             raise HTTPException(
                 status_code=400,
-                detail="Southwest longitude must be less than northeast longitude",
+                detail="Southwest longitude must differ from northeast longitude",
             )
 
-        # Build the $geoWithin bounding box query
-        geo_filter = {
-            "geojson": {
-                "$geoWithin": {
-                    "$box": [
-                        [
-                            southwest_lng,
-                            southwest_lat,
-                        ],  # MongoDB uses [lng, lat] format
-                        [northeast_lng, northeast_lat],
-                    ]
-                }
-            }
-        }
+        bbox = (southwest_lng, southwest_lat, northeast_lng, northeast_lat)
+
+        # If we have an in-memory spatial index, find the entities in it, and fetch only
+        # those entities from MongoDB.
+        spatial_index = await get_spatial_index(collection)
+        if spatial_index is not None:
+            ids = spatial_index.within_bbox(bbox)
+            documents_by_id = await find_documents_by_id(
+                collection, ids, projection=entity_projection()
+            )
+            documents = [documents_by_id[id] for id in ids if id in documents_by_id]
+            return entities_response(documents)
+
+        # Build the $geoWithin bounding box query, which the 2dsphere index can answer
+        # (unlike a `$box` query, which treats the coordinates as if they were planar).
+        geo_filter = bbox_filter(bbox)
 
         # Execute find with geospatial filter
-        cursor = collection.find(filter=geo_filter)
+        cursor = collection.find(filter=geo_filter, projection=entity_projection())
 
         # Convert cursor to list and convert to Entity objects
-        documents = list(cursor)
-        entities = []
-        for doc in documents:
-            entities.append(Entity(**clean_document(doc)))
-
-        return EntitiesResponse(documents=entities, count=len(entities))
+        documents = await cursor.to_list()
+        return entities_response(documents)
 
     except Exception as e:
         raise HTTPException(
@@ -295,32 +830,344 @@ def find_entities_in_bounding_box(
         )
 
 
+@app.post("/bertron/geo/within")
+async def find_entities_within_geometry(
+    query: GeoWithinQuery,
+) -> EntitiesResponse:
+    r"""Find entities located within a GeoJSON polygon or multipolygon (e.g. a watershed).
+
+    The polygons' edges are the shortest paths (along the Earth's surface) between their
+    vertices, so polygons may cross the antimeridian; and MongoDB can use the 2dsphere index
+    on the entities' locations to find the entities within them.
+
+    The entities are returned in pages (sorted by `id`) of (at most) `limit` entities, and
+    each page's `next` token can be passed as `after` to get the following page.
+
+    Example query body:
+    {
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[-123, 47], [-122, 47], [-122, 48], [-123, 48], [-123, 47]]]
+        },
+        "limit": 100
+    }
+    """
+    collection = await get_entities_collection()
+
+    try:
+        documents, next_token = await find_page(
+            collection,
+            filter={
+                "geojson": {"$geoWithin": {"$geometry": query.geometry.model_dump()}}
+            },
+            projection=entity_projection(),
+            limit=query.limit,
+            after=query.after,
+            max_time_ms=cfg.query_max_time_ms or None,
+        )
+        return entities_response(documents, next=next_token)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Within query error: {str(e)}")
+
+
+@app.get("/bertron/geo/clusters")
+async def find_entity_clusters(
+    bbox: str = Query(
+        ...,
+        description="Bounding box of the visible area, as `west,south,east,north` (in degrees)",
+    ),
+    zoom: int = Query(..., ge=0, le=MAX_ZOOM, description="Zoom level of the map"),
+) -> ClustersResponse:
+    r"""Group the entities within a bounding box into clusters, for displaying them on a map.
+
+    The entities are grouped by the cells of a grid whose cells are smaller at higher zoom
+    levels (at each zoom level, a map tile is 4 cells wide). Each cluster's position is the
+    centroid of its entities, so the response's size depends on the number of clusters
+    visible on the map, rather than on the number of entities.
+
+    Example: /bertron/geo/clusters?bbox=-125,24,-66,50&zoom=4
+    """
+    collection = await get_entities_collection()
+
+    try:
+        west, south, east, north = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cell_size = grid_cell_size(zoom)
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": bbox_filter((west, south, east, north))},
+        {
+            "$project": {
+                "_id": 0,
+                "ber_data_source": 1,
+                "longitude": {"$arrayElemAt": ["$geojson.coordinates", 0]},
+                "latitude": {"$arrayElemAt": ["$geojson.coordinates", 1]},
+            }
+        },
+        # Count the entities from each data source in each cell...
+        {
+            "$group": {
+                "_id": {
+                    "x": grid_cell_index("$longitude", 180, cell_size),
+                    "y": grid_cell_index("$latitude", 90, cell_size),
+                    "ber_data_source": "$ber_data_source",
+                },
+                "count": {"$sum": 1},
+                "longitude_sum": {"$sum": "$longitude"},
+                "latitude_sum": {"$sum": "$latitude"},
+            }
+        },
+        # ...and then combine those counts for each cell.
+        {
+            "$group": {
+                "_id": {"x": "$_id.x", "y": "$_id.y"},
+                "count": {"$sum": "$count"},
+                "longitude_sum": {"$sum": "$longitude_sum"},
+                "latitude_sum": {"$sum": "$latitude_sum"},
+                "ber_data_sources": {
+                    "$push": {"name": "$_id.ber_data_source", "count": "$count"}
+                },
+            }
+        },
+        {"$sort": {"count": -1, "_id.y": 1, "_id.x": 1}},
+    ]
+
+    try:
+        cursor = await collection.aggregate(pipeline)
+        cells = await cursor.to_list()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cluster query error: {str(e)}")
+
+    clusters = [
+        Cluster(
+            latitude=cell["latitude_sum"] / cell["count"],
+            longitude=cell["longitude_sum"] / cell["count"],
+            count=cell["count"],
+            ber_data_sources={
+                str(source["name"]): source["count"]
+                for source in cell["ber_data_sources"]
+            },
+        )
+        for cell in cells
+    ]
+    return ClustersResponse(
+        clusters=clusters,
+        count=len(clusters),
+        total=sum(cluster.count for cluster in clusters),
+        cell_size=cell_size,
+    )
+
+
+@app.get(
+    "/bertron/geo/features",
+    response_class=StreamingResponse,
+    responses={200: {"content": {GEOJSON_MEDIA_TYPE: {}}}},
+)
+async def get_entity_features(
+    bbox: Optional[str] = Query(
+        None,
+        description="Bounding box within which to find entities, as `west,south,east,north`",
+    ),
+    ber_data_source: Optional[str] = Query(
+        None, description="Include only the entities from this BER data source"
+    ),
+    entity_type: Optional[str] = Query(
+        None, description="Include only the entities of this entity type"
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description=(
+            "Comma-separated names of the `Entity` fields to include in each feature's "
+            f"properties (default: {','.join(DEFAULT_FEATURE_PROPERTIES)})"
+        ),
+    ),
+) -> StreamingResponse:
+    r"""Get the entities as a GeoJSON FeatureCollection, for use in GIS tools (e.g. QGIS, GDAL).
+
+    Each feature's geometry is the entity's location (or `null`, if the entity has none) and
+    its properties are the specified fields of the entity. The features are streamed to the
+    client as they are read from the database, so the server's memory usage does not grow
+    with the number of entities.
+
+    Example: /bertron/geo/features
+    Example: /bertron/geo/features?bbox=-125,24,-66,50&ber_data_source=NMDC&fields=id,name
+    """
+    collection = await get_entities_collection()
+
+    property_names = DEFAULT_FEATURE_PROPERTIES
+    if fields is not None:
+        property_names = [name.strip() for name in fields.split(",")]
+        unknown_names = [
+            name for name in property_names if name not in ENTITY_FIELD_NAMES
+        ]
+        if len(unknown_names) > 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown `Entity` fields: {', '.join(unknown_names)}",
+            )
+
+    filter: Dict[str, Any] = {}
+    if bbox is not None:
+        try:
+            filter.update(bbox_filter(parse_bbox(bbox)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if ber_data_source is not None:
+        filter["ber_data_source"] = ber_data_source
+    if entity_type is not None:
+        filter["entity_type"] = entity_type
+
+    cursor = collection.find(
+        filter=filter,
+        projection={
+            **{name: 1 for name in property_names},
+            "id": 1,
+            "geojson": 1,
+            "_id": 0,
+        },
+    )
+    cursor = cursor.batch_size(cfg.stream_batch_size)
+    return StreamingResponse(
+        iter_entities_as_geojson(cursor, property_names),
+        media_type=GEOJSON_MEDIA_TYPE,
+    )
+
+
+@app.get(
+    "/bertron/geo/tiles/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {MVT_MEDIA_TYPE: {}}}},
+)
+async def get_entity_tile(
+    z: int = Path(..., ge=0, le=MAX_ZOOM, description="Zoom level of the tile"),
+    x: int = Path(..., ge=0, description="Column of the tile"),
+    y: int = Path(..., ge=0, description="Row of the tile"),
+) -> Response:
+    r"""Get a Mapbox Vector Tile containing the locations of the entities within a map tile.
+
+    The tile has a single layer, named `entities`, containing a point for each entity. Each
+    point has the entity's `id`, `name`, `ber_data_source`, and `entity_type` (whose values
+    are joined with commas) as attributes. Tiles are cached until the data changes.
+
+    Example: /bertron/geo/tiles/3/1/2.mvt
+    """
+    collection = await get_entities_collection()
+
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(
+            status_code=400, detail=f"Zoom level {z} has no tile at ({x}, {y})"
+        )
+
+    generation = await get_ingest_generation()
+    cache_key = f"{z}/{x}/{y}"
+    if generation is not None:
+        content = tile_cache.get(cache_key, generation)
+        if content is not None:
+            return cached_response(content, is_hit=True, media_type=MVT_MEDIA_TYPE)
+
+    try:
+        cursor = collection.find(
+            filter=tile_filter(z, x, y),
+            projection={
+                "_id": 0,
+                "id": 1,
+                "name": 1,
+                "ber_data_source": 1,
+                "entity_type": 1,
+                "geojson.coordinates": 1,
+            },
+        )
+        cursor = cursor.batch_size(cfg.stream_batch_size)
+        features: List[PointFeature] = []
+        async for document in cursor:
+            longitude, latitude = document["geojson"]["coordinates"][:2]
+            feature_x, feature_y = project_to_tile(longitude, latitude, z, x, y)
+            if not (
+                -TILE_BUFFER <= feature_x < DEFAULT_EXTENT + TILE_BUFFER
+                and -TILE_BUFFER <= feature_y < DEFAULT_EXTENT + TILE_BUFFER
+            ):
+                continue
+            features.append((feature_x, feature_y, tile_attributes(document)))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Tile query error: {str(e)}")
+
+    content = encode_point_layer(TILE_LAYER_NAME, features)
+    if generation is not None:
+        tile_cache.put(cache_key, generation, content)
+    return cached_response(content, is_hit=False, media_type=MVT_MEDIA_TYPE)
+
+
+@app.get(
+    "/bertron/geo/points.bin",
+    response_class=Response,
+    responses={200: {"content": {POINTS_MEDIA_TYPE: {}}}},
+)
+async def get_entity_points(request: Request) -> Response:
+    r"""Get the locations of all entities, in a compact binary format.
+
+    The response contains the longitudes and latitudes of the entities (as little-endian
+    `float32` arrays), the BER data source of each entity (as a `uint8` array of positions in
+    a table of BER data sources), and a table of the entities' `id`s; which a browser can
+    view as typed arrays without parsing them. See `lib/points.py` for the details.
+
+    The response is built once per ingest generation and kept in memory, gzip-compressed;
+    it is sent compressed to clients that accept gzip-compressed responses.
+
+    Example: /bertron/geo/points.bin
+    """
+    collection = await get_entities_collection()
+
+    generation = await get_ingest_generation()
+    async with points_lock:
+        content = None
+        if generation is not None:
+            content = points_cache.get("points", generation)
+        is_hit = content is not None
+        if content is None:
+            try:
+                content = await build_points_feed(collection)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=400, detail=f"Points query error: {str(e)}"
+                )
+            if generation is not None:
+                points_cache.put("points", generation, content)
+
+    headers = {"X-Cache": "HIT" if is_hit else "MISS"}
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        # Note: We decompress the feed in a worker thread, so we don't block the event loop.
+        content = await asyncio.to_thread(gzip.decompress, content)
+    return Response(content=content, media_type=POINTS_MEDIA_TYPE, headers=headers)
+
+
 @app.get("/bertron/{id:path}")
-def get_entity_by_id(id: str) -> Optional[Entity]:
+async def get_entity_by_id(id: str) -> Optional[Entity]:
     r"""Get a single entity by its ID.
 
     Example: /bertron/emsl:12345
     """
-    db = mongo_client[cfg.mongo_database]
-
-    # Check if the collection exists
-    if "entities" not in db.list_collection_names():
-        raise HTTPException(status_code=404, detail="Entities collection not found")
-
-    collection = db["entities"]
+    collection = await get_entities_collection()
 
     try:
-        # Find the entity by ID - get all fields for proper validation
-        document = collection.find_one(filter={"id": id})
+        # Find the entity by ID - get all `Entity` fields for proper validation
+        document = await collection.find_one(
+            filter={"id": id}, projection=entity_projection()
+        )
 
         if not document:
             raise HTTPException(
                 status_code=404, detail=f"Entity with id '{id}' not found"
             )
 
-        # Validate and create Entity instance
+        # Validate and create Entity instance (unless the document is trusted)
         try:
-            entity = Entity(**clean_document(document))
+            entity = load_entity(document)
+            if isinstance(entity, dict):
+                return JSONResponse(content=entity)
             return entity
         except Exception as validation_error:
             logger.error(f"Entity validation failed for id '{id}': {validation_error}")
@@ -362,5 +1209,579 @@ def clean_document(
     return document
 
 
+def entity_projection(
+    projection: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    r"""
+    Returns a projection that makes MongoDB return only the `Entity` fields of documents,
+    narrowed down to the specified projection (if any).
+
+    Raises a `ValueError` if the specified projection does not include any `Entity` fields.
+    """
+    if projection is None:
+        merged_projection = dict(ENTITY_PROJECTION)
+        if cfg.trusted_reads and cfg.trusted_reads_schema_version is not None:
+            # Note: We need this field in order to decide whether to trust the document.
+            merged_projection["_metadata.schema_version"] = 1
+    elif is_inclusion_projection(projection):
+        merged_projection = {
+            key: value
+            for key, value in projection.items()
+            if key.split(".")[0] in ENTITY_FIELD_NAMES
+        }
+        if len(merged_projection) == 0:
+            raise ValueError("The projection does not include any `Entity` fields")
+        merged_projection["_id"] = 0
+    else:
+        merged_projection = {
+            **projection,
+            **{name: 0 for name in INGEST_FIELD_NAMES},
+            "_id": 0,
+        }
+    return merged_projection
+
+
+def is_trusted_document(document: Dict[str, Any]) -> bool:
+    r"""
+    Returns `True` if the document can be sent to the client without being validated
+    against the `Entity` model again, per the `trusted_reads` settings.
+
+    Note: The ingest script validates every document before storing it, and records the
+          version of the schema it used in the document's `_metadata`.
+    """
+    if not cfg.trusted_reads:
+        return False
+    if cfg.trusted_reads_schema_version is None:
+        return True
+    schema_version = get_path(document, "_metadata.schema_version")
+    return schema_version == cfg.trusted_reads_schema_version
+
+
+def load_entity(document: Dict[str, Any]) -> Union[Entity, Dict[str, Any]]:
+    r"""
+    Returns the document as an `Entity` or, if the document is trusted, as a dictionary
+    containing only its `Entity` fields (which is much cheaper to produce).
+    """
+    is_trusted = is_trusted_document(document)
+
+    # Note: The `entity_projection` has already removed all non-`Entity` fields, except the
+    #       one we needed to decide whether the document is trusted.
+    document.pop("_metadata", None)
+
+    return document if is_trusted else Entity(**document)
+
+
+def serialize_entity(document: Dict[str, Any]) -> str:
+    r"""Returns the document as a JSON-serialized `Entity`."""
+    entity = load_entity(document)
+    if isinstance(entity, dict):
+        return json.dumps(entity, ensure_ascii=False, separators=(",", ":"))
+    return entity.model_dump_json(by_alias=True)
+
+
+def entities_response(
+    documents: List[Dict[str, Any]],
+    model: Type[BaseModel] = EntitiesResponse,
+    **fields: Any,
+) -> Union[BaseModel, JSONResponse]:
+    r"""
+    Returns an `EntitiesResponse` (or another response model having `documents` and `count`
+    fields) containing the documents, and having the other specified fields.
+
+    If any of the documents are trusted, we return a `JSONResponse` with the same content
+    instead, since FastAPI would validate them against the `Entity` model otherwise.
+    Reference: https://fastapi.tiangolo.com/advanced/response-directly/
+    """
+    entities = [load_entity(doc) for doc in documents]
+    validated_entities = [e for e in entities if isinstance(e, Entity)]
+    if len(validated_entities) == len(entities):
+        return model(documents=validated_entities, count=len(entities), **fields)
+
+    content = model(documents=[], count=len(entities), **fields).model_dump(mode="json")
+    content["documents"] = [
+        e if isinstance(e, dict) else e.model_dump(mode="json", by_alias=True)
+        for e in entities
+    ]
+    return JSONResponse(content=content)
+
+
+def render_json(response: Union[BaseModel, JSONResponse]) -> bytes:
+    r"""Returns the JSON-serialized body of the response."""
+    if isinstance(response, JSONResponse):
+        return bytes(response.body)
+    return response.model_dump_json(by_alias=True).encode()
+
+
+async def build_points_feed(collection: AsyncCollection) -> bytes:
+    r"""Returns the gzip-compressed binary point feed describing all located entities."""
+    cursor = collection.find(
+        filter={"geojson.type": "Point"},
+        projection={"_id": 0, "id": 1, "ber_data_source": 1, "geojson.coordinates": 1},
+        sort=[("id", 1)],
+    )
+    cursor = cursor.batch_size(cfg.stream_batch_size)
+    points: List[Point] = []
+    async for document in cursor:
+        longitude, latitude = document["geojson"]["coordinates"][:2]
+        points.append(
+            (document["id"], longitude, latitude, str(document["ber_data_source"]))
+        )
+
+    # Note: We encode and compress the feed in a worker thread, so we don't block the event
+    #       loop; and we omit the timestamp from the gzip header, so the output only depends
+    #       on the data.
+    return await asyncio.to_thread(
+        lambda: gzip.compress(encode_points(points), compresslevel=6, mtime=0)
+    )
+
+
+def accepts_gzip(request: Request) -> bool:
+    r"""
+    Returns `True` if the request's `Accept-Encoding` header indicates that the client
+    accepts gzip-compressed responses.
+
+    Reference: https://www.rfc-editor.org/rfc/rfc9110#name-accept-encoding
+    """
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, parameters = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = parameters.strip().removeprefix("q=")
+            try:
+                return parameters == "" or float(quality) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def cached_response(
+    content: bytes, is_hit: bool, media_type: str = "application/json"
+) -> Response:
+    r"""Returns a response having the (cached or cacheable) content."""
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"X-Cache": "HIT" if is_hit else "MISS"},
+    )
+
+
+def is_not_modified(request: Request, etag: str, generation: IngestGeneration) -> bool:
+    r"""
+    Returns `True` if the request's preconditions indicate that the client already has the
+    current representation of the requested resource.
+
+    Note: Per RFC 9110, `If-Modified-Since` is ignored when `If-None-Match` is present.
+    Note: We don't treat `If-None-Match: *` as matching, since we check the preconditions
+          before we know whether the resource exists (e.g. whether there is an entity
+          having the requested `id`).
+    Reference: https://www.rfc-editor.org/rfc/rfc9110#name-if-none-match
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        client_etags = [tag.strip() for tag in if_none_match.split(",")]
+        return any(tag.removeprefix("W/") == etag for tag in client_etags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            client_last_modified = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        last_modified = generation.last_modified.replace(microsecond=0)
+        return (
+            client_last_modified.tzinfo is not None
+            and last_modified <= client_last_modified
+        )
+
+    return False
+
+
+async def find_page(
+    collection: AsyncCollection,
+    filter: Dict[str, Any],
+    projection: Optional[Dict[str, Any]] = None,
+    sort: Optional[Dict[str, int]] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    max_time_ms: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    r"""
+    Returns a page of the documents matching the filter, along with the continuation token
+    for the next page (or `None` if this is the last page).
+
+    The documents are sorted by the specified sort keys followed by `id` (or, if no sort keys
+    are specified, only by `id` and only when paginating), so that the token can locate the
+    next page via the indexes instead of having MongoDB skip documents. If a time limit is
+    specified, MongoDB aborts the query once it has run for that long.
+
+    Note: Only the `id` sort (the default) is backed by indexes that MongoDB can read the
+          pages from in order; i.e. the `id` index, and the compound indexes on
+          `ber_data_source`, `data_type`, and `entity_type` followed by `id` (for filters
+          on those fields). Sorting by any other field requires MongoDB to sort all the
+          matching documents for each page, so it is only fast for selective filters.
+
+    Raises a `ValueError` if the continuation token is invalid, or if paginating documents
+    sorted by a field whose values are arrays (e.g. `entity_type`).
+    """
+    is_paginated = limit is not None or after is not None
+    array_keys = [key for key in sort or {} if key.split(".")[0] in ARRAY_FIELD_NAMES]
+    if is_paginated and len(array_keys) > 0:
+        raise ValueError(
+            "Cannot paginate documents sorted by fields whose values are arrays: "
+            + ", ".join(array_keys)
+        )
+    sort_spec = keyset_sort(sort, is_paginated)
+    if after is not None:
+        after_filter = keyset_filter(sort_spec, decode_token(after, sort_spec))
+        filter = {"$and": [filter, after_filter]} if filter else after_filter
+
+    # Make sure the sort keys are present in the documents, so we can build the token.
+    query_projection, added_keys = projection_with_keys(
+        projection, [key for key, _ in sort_spec]
+    )
+
+    cursor = collection.find(filter=filter, projection=query_projection)
+    if len(sort_spec) > 0:
+        cursor = cursor.sort(sort_spec)
+    if skip:
+        cursor = cursor.skip(skip)
+    if limit:
+        # Note: We fetch one extra document so we know whether there is a next page.
+        cursor = cursor.limit(limit + 1)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    documents = await cursor.to_list()
+
+    next_token = None
+    if limit and len(documents) > limit:
+        documents = documents[:limit]
+        next_token = encode_token(sort_spec, documents[-1])
+    for document in documents:
+        for key in added_keys:
+            pop_path(document, key)
+
+    return documents, next_token
+
+
+async def find_nearby_page(
+    collection: AsyncCollection,
+    longitude: float,
+    latitude: float,
+    radius_meters: float,
+    projection: Dict[str, Any],
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    max_results: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], List[float], Optional[str]]:
+    r"""
+    Returns a page of the documents located within the radius of the point (closest first),
+    their distances (in meters) from the point, and the continuation token for the next page
+    (or `None` if this is the last page).
+
+    The continuation token records the distance of the last document on the page, so the
+    next page can start at that distance; and the `id`s of the documents already returned
+    at that distance, so they can be excluded. Unlike re-sorting the documents by `id`, this
+    lets MongoDB stop reading documents once it has found a page's worth of them.
+
+    Raises a `ValueError` if the continuation token is invalid.
+    """
+    min_distance, returned_ids, num_returned = 0.0, [], 0
+    if after is not None:
+        min_distance, returned_ids, num_returned = decode_distance_token(after)
+
+    page_size = limit
+    if max_results is not None:
+        page_size = min(page_size or max_results, max_results - num_returned)
+    if page_size is not None and page_size <= 0:
+        return [], [], None
+
+    # Make sure the `id` is present in the documents, so we can build the token.
+    # Note: We fetch one extra document so we know whether there is a next page.
+    query_projection, added_keys = projection_with_keys(projection, ["id"])
+    num_to_fetch = None if page_size is None else page_size + 1
+
+    spatial_index = await get_spatial_index(collection)
+    if spatial_index is not None:
+        # Find the entities in memory, and fetch only the ones on this page from MongoDB.
+        ids, all_distances = spatial_index.nearby(longitude, latitude, radius_meters)
+        start = bisect.bisect_left(all_distances, min_distance)
+        excluded_ids = set(returned_ids)
+        page = list(
+            itertools.islice(
+                (
+                    (id, distance)
+                    for id, distance in zip(ids[start:], all_distances[start:])
+                    if id not in excluded_ids
+                ),
+                num_to_fetch,
+            )
+        )
+        documents_by_id = await find_documents_by_id(
+            collection, [id for id, _ in page], query_projection
+        )
+        page = [(id, distance) for id, distance in page if id in documents_by_id]
+        documents = [documents_by_id[id] for id, _ in page]
+        distances = [distance for _, distance in page]
+    else:
+        geo_near: Dict[str, Any] = {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "key": "geojson",
+            "distanceField": "_distance",
+            "spherical": True,
+            "minDistance": min_distance,
+            "maxDistance": radius_meters,
+        }
+        if len(returned_ids) > 0:
+            geo_near["query"] = {"id": {"$nin": returned_ids}}
+        pipeline: List[Dict[str, Any]] = [{"$geoNear": geo_near}]
+        if num_to_fetch is not None:
+            pipeline.append({"$limit": num_to_fetch})
+        pipeline.append({"$project": {**(query_projection or {}), "_distance": 1}})
+
+        cursor = await collection.aggregate(pipeline)
+        documents = await cursor.to_list()
+        distances = [document.pop("_distance") for document in documents]
+
+    has_next_page = page_size is not None and len(documents) > page_size
+    documents = documents[:page_size]
+    distances = distances[:page_size]
+
+    next_token = None
+    num_returned += len(documents)
+    if has_next_page and (max_results is None or num_returned < max_results):
+        last_distance = distances[-1]
+        last_ids = returned_ids if last_distance == min_distance else []
+        last_ids = last_ids + [
+            document["id"]
+            for document, distance in zip(documents, distances)
+            if distance == last_distance
+        ]
+        next_token = encode_distance_token(last_distance, last_ids, num_returned)
+    for document in documents:
+        for key in added_keys:
+            pop_path(document, key)
+    return documents, distances, next_token
+
+
+async def find_documents_by_id(
+    collection: AsyncCollection,
+    ids: List[str],
+    projection: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    r"""
+    Returns the documents having the specified `id`s, keyed by `id`.
+
+    Note: We fetch the documents in batches, so that no query's `$in` list is very long.
+    """
+    documents_by_id = {}
+    for start in range(0, len(ids), ID_LOOKUP_BATCH_SIZE):
+        cursor = collection.find(
+            filter={"id": {"$in": ids[start : start + ID_LOOKUP_BATCH_SIZE]}},
+            projection=projection,
+        )
+        async for document in cursor:
+            documents_by_id[document["id"]] = document
+    return documents_by_id
+
+
+async def count_matches(
+    collection: AsyncCollection,
+    filter: Dict[str, Any],
+    include_total: bool = False,
+    facet_fields: Sequence[str] = (),
+    max_time_ms: Optional[int] = None,
+) -> Tuple[Optional[int], Optional[Dict[str, Dict[str, int]]]]:
+    r"""
+    Returns the number of documents matching the filter (if `include_total` is true), and the
+    number of those documents having each value of each of the facet fields (if there are any).
+
+    When there are facet fields, we get all of the counts via a single aggregation, in which
+    MongoDB finds the matching documents once and then counts them in each way (via `$facet`).
+    Otherwise, we count the documents directly; and if the filter matches all of them, we use
+    the collection's metadata instead of counting them.
+
+    Reference: https://www.mongodb.com/docs/manual/reference/operator/aggregation/facet/
+    """
+    # Note: PyMongo passes these options along with the command it sends to MongoDB.
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    if len(facet_fields) == 0:
+        if not include_total:
+            return None, None
+        if not filter:
+            return await collection.estimated_document_count(), None
+        return await collection.count_documents(filter, **options), None
+
+    # Note: We `$unwind` each field, so that documents having a list of values (e.g. of
+    #       `entity_type`) are counted once per value. Documents lacking a value are skipped.
+    facet_pipelines: Dict[str, List[Dict[str, Any]]] = {
+        field: [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+        ]
+        for field in facet_fields
+    }
+    if include_total:
+        facet_pipelines["_total"] = [{"$count": "count"}]
+    cursor = await collection.aggregate(
+        [{"$match": filter}, {"$facet": facet_pipelines}], **options
+    )
+    result = (await cursor.to_list())[0]
+
+    total = None
+    if include_total:
+        total = result["_total"][0]["count"] if result["_total"] else 0
+    facets = {
+        field: {str(bucket["_id"]): bucket["count"] for bucket in result[field]}
+        for field in facet_fields
+    }
+    return total, facets
+
+
+async def query_time_limit(
+    collection: AsyncCollection,
+    filter: Dict[str, Any],
+    sort: Optional[Dict[str, int]] = None,
+    is_paginated: bool = False,
+) -> Optional[int]:
+    r"""
+    Returns the time limit (in milliseconds) with which to run the query, or `None` if it
+    can run for as long as it takes. The query is sorted as `find_page` would sort it.
+
+    If `cfg.query_collscan_max_docs` is specified, we first ask MongoDB how it would run the
+    query (without running it). If MongoDB would read the whole collection and the collection
+    is larger than that, we either raise a `ValueError` or (if `cfg.query_collscan_max_time_ms`
+    is specified) return that time limit instead.
+
+    Reference: https://www.mongodb.com/docs/manual/reference/command/explain/
+    """
+    max_time_ms = cfg.query_max_time_ms or None
+    if cfg.query_collscan_max_docs is None:
+        return max_time_ms
+
+    # Note: We use the "queryPlanner" verbosity, so that MongoDB only plans the query.
+    explanation = await collection.database.command(
+        {
+            "explain": {
+                "find": collection.name,
+                "filter": filter,
+                "sort": dict(keyset_sort(sort, is_paginated)),
+            },
+            "verbosity": "queryPlanner",
+        }
+    )
+    if not is_collection_scan(explanation):
+        return max_time_ms
+    num_documents = await collection.estimated_document_count()
+    if num_documents <= cfg.query_collscan_max_docs:
+        return max_time_ms
+    if cfg.query_collscan_max_time_ms is not None:
+        return min(max_time_ms or math.inf, cfg.query_collscan_max_time_ms)
+    raise ValueError(
+        f"The query would read all {num_documents} documents, since no index "
+        "can be used to evaluate the filter and sort; try filtering on indexed "
+        "fields (e.g. `id` or `ber_data_source`)"
+    )
+
+
+def tile_filter(z: int, x: int, y: int) -> Dict[str, Any]:
+    r"""
+    Returns a filter matching the documents located within the specified map tile (including
+    its buffer), which MongoDB can evaluate via the 2dsphere index on the `geojson` field.
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    longitude_margin = (east - west) * TILE_BUFFER / DEFAULT_EXTENT
+    latitude_margin = (north - south) * TILE_BUFFER / DEFAULT_EXTENT
+    west, east = max(-180, west - longitude_margin), min(180, east + longitude_margin)
+    south, north = max(-90, south - latitude_margin), min(90, north + latitude_margin)
+
+    # Note: The filter needn't be elaborate when the tile spans the whole world.
+    if west == -180 and east == 180:
+        return {"geojson": {"$exists": True}}
+    return bbox_filter((west, south, east, north))
+
+
+def tile_attributes(document: Dict[str, Any]) -> Dict[str, str]:
+    r"""
+    Returns the attributes of the point representing the entity in vector tiles.
+
+    >>> tile_attributes({"id": "a", "ber_data_source": "EMSL", "entity_type": ["sample", "site"]})
+    {'id': 'a', 'ber_data_source': 'EMSL', 'entity_type': 'sample,site'}
+    """
+    attributes = {}
+    for name in ["id", "name", "ber_data_source"]:
+        if isinstance(document.get(name), str):
+            attributes[name] = document[name]
+    if isinstance(document.get("entity_type"), list):
+        attributes["entity_type"] = ",".join(map(str, document["entity_type"]))
+    return attributes
+
+
+def grid_cell_index(field: str, offset: float, cell_size: float) -> Dict[str, Any]:
+    r"""
+    Returns an aggregation expression that evaluates to the index of the grid cell (along
+    one axis) containing the value of the field, when that axis starts at `-offset`.
+    """
+    return {"$floor": {"$divide": [{"$add": [field, offset]}, cell_size]}}
+
+
+def accepts_ndjson(request: Request) -> bool:
+    r"""Returns `True` if the request's `Accept` header lists the NDJSON media type."""
+    accept_header = request.headers.get("accept", "")
+    media_types = [
+        media_range.split(";")[0].strip().lower()
+        for media_range in accept_header.split(",")
+    ]
+    return NDJSON_MEDIA_TYPE in media_types
+
+
+async def iter_entities_as_ndjson(cursor: AsyncCursor) -> AsyncIterator[str]:
+    r"""Yields each document from the cursor as an `Entity` serialized onto its own line."""
+    async for doc in cursor:
+        yield serialize_entity(doc) + "\n"
+
+
+async def iter_entities_as_json(cursor: AsyncCursor) -> AsyncIterator[str]:
+    r"""
+    Yields the documents from the cursor as fragments of a JSON-serialized `EntitiesResponse`.
+
+    The `count` field is emitted after the last entity, since it is not known until then.
+    The other fields have their default values (e.g. `next` is `null`, since streamed
+    responses are not paginated).
+    """
+    count = 0
+    yield '{"documents":['
+    async for doc in cursor:
+        separator = "," if count > 0 else ""
+        yield separator + serialize_entity(doc)
+        count += 1
+    trailer = EntitiesResponse(documents=[], count=count).model_dump_json(by_alias=True)
+    yield "]," + trailer.removeprefix('{"documents":[],')
+
+
+async def iter_entities_as_geojson(
+    cursor: AsyncCursor, property_names: List[str]
+) -> AsyncIterator[str]:
+    r"""
+    Yields the documents from the cursor as fragments of a GeoJSON FeatureCollection, whose
+    features have the documents' `geojson` as their geometry and the specified fields of the
+    documents as their properties.
+
+    Reference: https://www.rfc-editor.org/rfc/rfc7946#section-3.3
+    """
+    yield '{"type":"FeatureCollection","features":['
+    separator = ""
+    async for document in cursor:
+        feature = {
+            "type": "Feature",
+            "id": document["id"],
+            "geometry": document.get("geojson"),
+            "properties": {name: document.get(name) for name in property_names},
+        }
+        yield separator + json.dumps(feature, ensure_ascii=False, separators=(",", ":"))
+        separator = ","
+    yield "]}"
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
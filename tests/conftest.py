@@ -51,6 +51,10 @@ def patched_config(monkeypatch):
     monkeypatch.setattr("config.settings.mongo_database", test_database_name)
     monkeypatch.setattr("src.config.settings.mongo_database", test_database_name)
 
+    # We also make the API look up the ingest generation on every request, since the tests
+    # change the data (e.g. by re-seeding the database) faster than the lookups expire.
+    monkeypatch.setattr("server.generation_tracker.ttl_seconds", 0.0)
+
     # Finally, we yield control to the test that depends on this fixture.
     # Note: After the test completes, `monkeypatch` will automatically un-patch things.
     yield
@@ -1,3 +1,4 @@
+import json
 from typing import Dict, Any
 
 from fastapi.testclient import TestClient
@@ -5,13 +6,17 @@ from pymongo.database import Database
 import pytest
 from starlette import status
 
+from lib.points import decode_points
 from server import app
 
 
 @pytest.fixture
 def test_client():
-    test_client = TestClient(app)
-    yield test_client
+    # Note: We use the `TestClient` as a context manager so that the app's `lifespan`
+    #       handler runs (which is what connects the app to the database).
+    #       Reference: https://fastapi.tiangolo.com/advanced/testing-events/
+    with TestClient(app) as test_client:
+        yield test_client
 
 
 class TestBertronAPI:
@@ -45,6 +50,103 @@ class TestBertronAPI:
             entity = entities_data["documents"][0]
             self._verify_entity_structure(entity)
 
+    def test_get_all_entities_as_ndjson(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test streaming all entities as newline-delimited JSON."""
+        response = test_client.get(
+            "/bertron", headers={"Accept": "application/x-ndjson"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        # Each non-empty line should be a single, complete entity.
+        lines = [line for line in response.text.split("\n") if line != ""]
+        assert len(lines) == seeded_db.entities.count_documents({})
+        for line in lines:
+            self._verify_entity_structure(json.loads(line))
+
+    def test_get_all_entities_streamed_json_matches_buffered_json(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that the streamed JSON response has the same content as the buffered one."""
+        buffered_response = test_client.get("/bertron")
+        streamed_response = test_client.get("/bertron", params={"stream": "true"})
+
+        assert streamed_response.status_code == status.HTTP_200_OK
+        assert streamed_response.json() == buffered_response.json()
+
+    def test_get_all_entities_after_collection_is_created(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that a missing collection is noticed once it is (re)created."""
+        documents = list(seeded_db.entities.find({}))
+        seeded_db.entities.drop()
+
+        response = test_client.get("/bertron")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        seeded_db.entities.insert_many(documents)
+
+        response = test_client.get("/bertron")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["count"] == len(documents)
+
+    def test_conditional_get_all_entities(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that a conditional GET for unchanged data gets a 304 response."""
+        response = test_client.get("/bertron")
+        assert response.status_code == status.HTTP_200_OK
+        etag = response.headers["etag"]
+        last_modified = response.headers["last-modified"]
+
+        response = test_client.get("/bertron", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = test_client.get(
+            "/bertron", headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        # A different representation of the resource has a different entity tag.
+        response = test_client.get(
+            "/bertron",
+            headers={"If-None-Match": etag, "Accept": "application/x-ndjson"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
+
+    def test_conditional_get_after_ingest(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that the entity tag changes when the ingest generation does."""
+        entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+        etag = test_client.get(f"/bertron/{entity_id}").headers["etag"]
+
+        seeded_db.ingest_state.update_one(
+            {"_id": "entities"}, {"$inc": {"generation": 1}}
+        )
+
+        response = test_client.get(
+            f"/bertron/{entity_id}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
+        assert response.json()["id"] == entity_id
+
+    def test_conditional_get_missing_entity(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that a conditional GET for an entity that doesn't exist gets a 404 response."""
+        response = test_client.get(
+            "/bertron/nonexistent:entity", headers={"If-None-Match": "*"}
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
     def test_get_entity_by_id_emsl(self, test_client: TestClient, seeded_db: Database):
         """Test getting a specific EMSL entity by ID."""
         entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
@@ -107,6 +209,68 @@ class TestBertronAPI:
 
         self._verify_entity_structure(entity)
 
+    def test_get_entity_by_id_with_trusted_reads(
+        self, test_client: TestClient, seeded_db: Database, monkeypatch
+    ):
+        """Test that trusted documents are returned as they were stored."""
+        entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+        validated_entity = test_client.get(f"/bertron/{entity_id}").json()
+
+        monkeypatch.setattr("config.settings.trusted_reads", True)
+        response = test_client.get(f"/bertron/{entity_id}")
+
+        assert response.status_code == status.HTTP_200_OK
+        trusted_entity = response.json()
+        self._verify_entity_structure(trusted_entity)
+
+        # The trusted entity lacks the optional fields that the stored document lacks
+        # (at any level), but otherwise has the same content as the validated entity.
+        for field_name in ["id", "ber_data_source", "entity_type", "name", "uri"]:
+            assert trusted_entity[field_name] == validated_entity[field_name]
+        for field_name in ["latitude", "longitude"]:
+            assert (
+                trusted_entity["coordinates"][field_name]
+                == validated_entity["coordinates"][field_name]
+            )
+        assert "_metadata" not in trusted_entity
+        assert "geojson" not in trusted_entity
+
+    def test_trusted_reads_validate_documents_from_other_schema_versions(
+        self, test_client: TestClient, seeded_db: Database, monkeypatch
+    ):
+        """Test that documents ingested using another schema version are still validated."""
+        validated_entities = test_client.get("/bertron").json()
+
+        monkeypatch.setattr("config.settings.trusted_reads", True)
+        monkeypatch.setattr(
+            "config.settings.trusted_reads_schema_version", "some-other-version"
+        )
+        response = test_client.get("/bertron")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == validated_entities
+
+    def test_get_entities_by_ids(self, test_client: TestClient, seeded_db: Database):
+        """Test getting multiple entities by their IDs in one request."""
+        ids = [
+            "nmdc:bsm-11-bsf8yq62",
+            "nonexistent:12345",
+            "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488",
+            "nmdc:bsm-11-bsf8yq62",
+        ]
+        response = test_client.post("/bertron/batch", json={"ids": ids})
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert [entity["id"] for entity in data["documents"]] == [ids[0], ids[2]]
+        assert data["count"] == 2
+        assert data["missing"] == ["nonexistent:12345"]
+        for entity in data["documents"]:
+            self._verify_entity_structure(entity)
+
+        response = test_client.post("/bertron/batch", json={"ids": ["x"] * 1001})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
     def test_get_entity_by_id_not_found(
         self, test_client: TestClient, seeded_db: Database
     ):
@@ -166,6 +330,32 @@ class TestBertronAPI:
             assert "ber_data_source" in entity
             assert "coordinates" in entity
 
+    def test_find_entities_with_exclusion_projection(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that an exclusion projection doesn't let non-Entity fields through."""
+        query = {"filter": {}, "projection": {"properties": 0}, "limit": 5}
+
+        response = test_client.post("/bertron/find", json=query)
+
+        assert response.status_code == status.HTTP_200_OK
+        for document in response.json()["documents"]:
+            assert "id" in document
+            assert "properties" not in document
+            for field_name in ["_id", "_metadata", "geojson"]:
+                assert field_name not in document
+
+    def test_find_entities_with_projection_of_non_entity_fields(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that a projection of only non-Entity fields is rejected."""
+        query = {"filter": {}, "projection": {"_metadata": 1, "geojson": 1}}
+
+        response = test_client.post("/bertron/find", json=query)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "Entity" in response.json()["detail"]
+
     def test_find_entities_with_sort_and_limit(
         self, test_client: TestClient, seeded_db: Database
     ):
@@ -189,6 +379,139 @@ class TestBertronAPI:
                 next_entity = entities_data["documents"][i + 1]
                 assert current["ber_data_source"] <= next_entity["ber_data_source"]
 
+    def test_find_entities_paginated_with_continuation_token(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test paging through all entities using continuation tokens."""
+        query: Dict[str, Any] = {"filter": {}, "sort": {"ber_data_source": 1}, "limit": 2}
+
+        seen_ids = []
+        for _ in range(10):  # guard against infinite loops
+            response = test_client.post("/bertron/find", json=query)
+            assert response.status_code == status.HTTP_200_OK
+            page = response.json()
+            assert page["count"] <= 2
+            seen_ids.extend(entity["id"] for entity in page["documents"])
+            if page["next"] is None:
+                break
+            query["after"] = page["next"]
+
+        # Every entity should have been returned exactly once.
+        assert len(seen_ids) == len(set(seen_ids))
+        assert set(seen_ids) == set(seeded_db.entities.distinct("id"))
+
+    def test_find_entities_with_projection_paginated(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that the sort keys needed for the token don't leak into projected documents."""
+        query = {"filter": {}, "projection": {"name": 1}, "limit": 1}
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert page["next"] is not None
+        assert "id" not in page["documents"][0]
+
+    def test_find_entities_rejects_paging_by_array_field(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that pages can't be sorted by fields whose values are arrays."""
+        query = {"filter": {}, "sort": {"entity_type": 1}, "limit": 1}
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "entity_type" in response.json()["detail"]
+
+        # Note: Without pagination, MongoDB can sort by an array field.
+        query = {"filter": {}, "sort": {"entity_type": 1}}
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_find_entities_invalid_continuation_token(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that a malformed continuation token is rejected."""
+        query = {"filter": {}, "after": "not-a-token"}
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "continuation token" in response.json()["detail"]
+
+    def test_get_all_entities_paginated(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test paging through GET /bertron using continuation tokens."""
+        first_page = test_client.get("/bertron", params={"limit": 2}).json()
+        assert first_page["count"] == 2
+        assert first_page["next"] is not None
+
+        second_page = test_client.get(
+            "/bertron", params={"limit": 2, "after": first_page["next"]}
+        ).json()
+        first_ids = [entity["id"] for entity in first_page["documents"]]
+        second_ids = [entity["id"] for entity in second_page["documents"]]
+        assert first_ids == sorted(first_ids)
+        assert max(first_ids) < min(second_ids)
+
+    def test_find_entities_with_total_and_facets(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that the total and facet counts cover all matching entities, not just the page."""
+        num_entities = seeded_db.entities.count_documents({})
+        num_emsl_entities = seeded_db.entities.count_documents(
+            {"ber_data_source": "EMSL"}
+        )
+
+        response = test_client.post(
+            "/bertron/find", json={"limit": 1, "include_total": True}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["count"] == 1
+        assert data["total"] == num_entities
+        assert data["facets"] is None
+
+        query = {
+            "filter": {"ber_data_source": "EMSL"},
+            "limit": 1,
+            "include_total": True,
+            "facets": ["ber_data_source", "entity_type"],
+        }
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["total"] == num_emsl_entities
+        assert data["facets"]["ber_data_source"] == {"EMSL": num_emsl_entities}
+        assert sum(data["facets"]["entity_type"].values()) >= num_emsl_entities
+
+        # Only some fields can be faceted on.
+        response = test_client.post("/bertron/find", json={"facets": ["name"]})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_find_entities_cached(self, test_client: TestClient, seeded_db: Database):
+        """Test that repeated queries are answered from the cache until the data changes."""
+        query = {"filter": {"ber_data_source": "EMSL", "entity_type": "sample"}}
+        equivalent_query = {
+            "filter": {"entity_type": "sample", "ber_data_source": "EMSL"}
+        }
+        hits = test_client.get("/cache").json()["hits"]
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["x-cache"] == "MISS"
+
+        cached_response = test_client.post("/bertron/find", json=equivalent_query)
+        assert cached_response.status_code == status.HTTP_200_OK
+        assert cached_response.headers["x-cache"] == "HIT"
+        assert cached_response.json() == response.json()
+        assert test_client.get("/cache").json()["hits"] == hits + 1
+
+        seeded_db.ingest_state.update_one(
+            {"_id": "entities"}, {"$inc": {"generation": 1}}
+        )
+        response = test_client.post("/bertron/find", json=query)
+        assert response.headers["x-cache"] == "MISS"
+
     def test_find_entities_invalid_query(
         self, test_client: TestClient, seeded_db: Database
     ):
@@ -203,6 +526,75 @@ class TestBertronAPI:
         error_data = response.json()
         assert "Query error" in error_data["detail"]
 
+    def test_find_entities_with_disallowed_operator(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that filters using operators that could run arbitrary code are rejected."""
+        query = {"filter": {"$or": [{"$where": "sleep(100) || true"}, {"id": "x"}]}}
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "$where" in response.json()["detail"]
+
+    def test_find_entities_with_projection_expression(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test that projections using expressions that could run arbitrary code are rejected."""
+        query = {
+            "filter": {},
+            "projection": {
+                "name": {"$function": {"body": "sleep(100)", "args": [], "lang": "js"}}
+            },
+        }
+
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "name" in response.json()["detail"]
+
+    def test_find_entities_rejects_collection_scan(
+        self, test_client: TestClient, seeded_db: Database, monkeypatch
+    ):
+        """Test that queries MongoDB can't use an index for are rejected, if configured so."""
+        monkeypatch.setattr("config.settings.query_collscan_max_docs", 1)
+
+        # Note: The `description` field is not indexed.
+        query = {"filter": {"description": "Clostridium thermocellum protein extracts"}}
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "index" in response.json()["detail"]
+
+        query = {"filter": {"ber_data_source": "EMSL"}}
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+
+        # Queries MongoDB can't use an index for can be run with a shorter time limit instead.
+        monkeypatch.setattr("config.settings.query_collscan_max_time_ms", 1000)
+        query = {"filter": {"description": "Clostridium thermocellum protein extracts"}}
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["count"] == 1
+
+    def test_find_entities_rejects_full_index_scan(
+        self, test_client: TestClient, seeded_db: Database, monkeypatch
+    ):
+        """Test that sorting on an indexed field doesn't let an unindexed filter through."""
+        monkeypatch.setattr("config.settings.query_collscan_max_docs", 1)
+
+        # Note: MongoDB would read the whole `id` (or `ber_data_source`) index, in order to
+        #       sort the documents, and fetch every document to evaluate the filter.
+        filter = {"description": "Clostridium thermocellum protein extracts"}
+        for query in [
+            {"filter": filter, "limit": 2},
+            {"filter": filter, "sort": {"ber_data_source": 1}, "limit": 2},
+        ]:
+            response = test_client.post("/bertron/find", json=query)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert "index" in response.json()["detail"]
+
+        query = {"filter": {}, "limit": 2}
+        response = test_client.post("/bertron/find", json=query)
+        assert response.status_code == status.HTTP_200_OK
+
     def test_geo_nearby_search(self, test_client: TestClient, seeded_db: Database):
         """Test geographic nearby search."""
         # Search near the EMSL coordinates (34, 118.0)
@@ -229,6 +621,145 @@ class TestBertronAPI:
 
         assert found_emsl, "Should find the EMSL entity in nearby search"
 
+    def test_geo_nearby_search_paginated(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test getting nearby entities in pages, closest first, with their distances."""
+        params = {
+            "latitude": 34.0,
+            "longitude": 118.0,
+            "radius_meters": 20_000_000,  # i.e. the whole world
+        }
+        all_entities = test_client.get("/bertron/geo/nearby", params=params).json()
+        assert all_entities["next"] is None
+        assert all_entities["distances"] == sorted(all_entities["distances"])
+        assert all_entities["distances"][0] == pytest.approx(0)
+
+        ids, distances = [], []
+        page = {"next": None}
+        while True:
+            page_params = {**params, "limit": 2, "fields": "id,name"}
+            if page["next"] is not None:
+                page_params["after"] = page["next"]
+            response = test_client.get("/bertron/geo/nearby", params=page_params)
+            assert response.status_code == status.HTTP_200_OK
+            page = response.json()
+            assert all(set(doc.keys()) <= {"id", "name"} for doc in page["documents"])
+            ids.extend(doc["id"] for doc in page["documents"])
+            distances.extend(page["distances"])
+            if page["next"] is None:
+                break
+        assert ids == [entity["id"] for entity in all_entities["documents"]]
+        assert distances == all_entities["distances"]
+
+        params["max_results"] = 3
+        response = test_client.get("/bertron/geo/nearby", params=params)
+        assert response.json()["count"] == 3
+        assert response.json()["next"] is None
+
+    def test_geo_nearby_batch_search(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test finding the entities near several points, each entity being included once."""
+        points = [
+            {"latitude": 34.0, "longitude": 118.0, "radius_meters": 2e7, "limit": 3},
+            {"latitude": 34.0, "longitude": 118.0, "radius_meters": 1000},
+            {"latitude": 0.0, "longitude": 0.0, "radius_meters": 1},
+        ]
+        response = test_client.post(
+            "/bertron/geo/nearby/batch", json={"points": points}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+
+        results = data["results"]
+        assert len(results) == len(points)
+        nearby = test_client.get("/bertron/geo/nearby", params=points[0]).json()
+        assert results[0]["ids"] == [doc["id"] for doc in nearby["documents"][:3]]
+        assert results[0]["distances"] == pytest.approx(nearby["distances"][:3])
+        assert results[1]["ids"] == ["EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"]
+        assert results[2] == {"ids": [], "distances": []}
+
+        ids = [doc["id"] for doc in data["documents"]]
+        assert sorted(ids) == sorted(set(results[0]["ids"]))
+        assert data["count"] == len(ids)
+
+        response = test_client.post("/bertron/geo/nearby/batch", json={"points": []})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_geo_points_feed(self, test_client: TestClient, seeded_db: Database):
+        """Test getting the locations of all entities in the binary point feed."""
+        response = test_client.get("/bertron/geo/points.bin")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-encoding"] == "gzip"
+        points = decode_points(response.content)  # note: `httpx` decompresses it
+        assert len(points) == seeded_db.entities.count_documents(
+            {"geojson.type": "Point"}
+        )
+        entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+        assert (entity_id, 118.0, 34.0, "EMSL") in points
+
+        response = test_client.get(
+            "/bertron/geo/points.bin", headers={"Accept-Encoding": "identity"}
+        )
+        assert "content-encoding" not in response.headers
+        assert response.headers["x-cache"] == "HIT"
+        assert decode_points(response.content) == points
+
+    def test_geo_features(self, test_client: TestClient, seeded_db: Database):
+        """Test getting entities as a GeoJSON FeatureCollection."""
+        response = test_client.get("/bertron/geo/features")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("application/geo+json")
+        collection = response.json()
+        assert collection["type"] == "FeatureCollection"
+        assert len(collection["features"]) == seeded_db.entities.count_documents({})
+
+        entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+        feature = next(f for f in collection["features"] if f["id"] == entity_id)
+        assert feature["type"] == "Feature"
+        assert feature["geometry"] == {"type": "Point", "coordinates": [118.0, 34.0]}
+        assert feature["properties"]["ber_data_source"] == "EMSL"
+
+        params = {"bbox": "117,33,119,35", "fields": "id,name"}
+        response = test_client.get("/bertron/geo/features", params=params)
+        features = response.json()["features"]
+        assert [f["id"] for f in features] == [entity_id]
+        assert set(features[0]["properties"].keys()) == {"id", "name"}
+
+        params = {"fields": "id,not_a_field"}
+        response = test_client.get("/bertron/geo/features", params=params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_geo_search_via_spatial_index(
+        self, test_client: TestClient, seeded_db: Database, monkeypatch
+    ):
+        """Test that the in-memory spatial index finds the same entities as MongoDB."""
+        pytest.importorskip("numpy")
+        nearby_params = {"latitude": 34.0, "longitude": 118.0, "radius_meters": 2e7}
+        bbox_params = {
+            "southwest_lat": -60.0,
+            "southwest_lng": -170.0,
+            "northeast_lat": 70.0,
+            "northeast_lng": 170.0,
+        }
+        via_database = [
+            test_client.get("/bertron/geo/nearby", params=nearby_params).json(),
+            test_client.get("/bertron/geo/bbox", params=bbox_params).json(),
+        ]
+
+        monkeypatch.setattr("config.settings.spatial_index", True)
+        nearby = test_client.get("/bertron/geo/nearby", params=nearby_params).json()
+        assert [doc["id"] for doc in nearby["documents"]] == [
+            doc["id"] for doc in via_database[0]["documents"]
+        ]
+        assert nearby["distances"] == pytest.approx(via_database[0]["distances"])
+
+        bbox = test_client.get("/bertron/geo/bbox", params=bbox_params).json()
+        assert sorted(doc["id"] for doc in bbox["documents"]) == sorted(
+            doc["id"] for doc in via_database[1]["documents"]
+        )
+
     def test_geo_nearby_search_invalid_params(
         self, test_client: TestClient, seeded_db: Database
     ):
@@ -276,6 +807,49 @@ class TestBertronAPI:
 
         assert found_ess_dive, "Should find ESS-DIVE entities in Alaska bounding box"
 
+    def test_geo_bounding_box_search_across_antimeridian(
+        self, test_client: TestClient, seeded_db: Database
+    ):
+        """Test bounding box search with a bounding box that crosses the antimeridian."""
+        params = {
+            "southwest_lat": 64.0,
+            "southwest_lng": 170.0,
+            "northeast_lat": 66.0,
+            "northeast_lng": -163.0,
+        }
+
+        response = test_client.get("/bertron/geo/bbox", params=params)
+
+        assert response.status_code == status.HTTP_200_OK
+        entities_data = response.json()
+        assert entities_data["count"] > 0
+        for entity in entities_data["documents"]:
+            lng = entity["coordinates"]["longitude"]
+            assert lng >= 170.0 or lng <= -163.0
+
+    def test_geo_within_polygon(self, test_client: TestClient, seeded_db: Database):
+        """Test finding the entities located within a polygon."""
+        # A polygon around Alaska (ESS-DIVE data), and one around the middle of the Pacific.
+        alaska = [[[-166, 64], [-163, 64], [-163, 66], [-166, 66], [-166, 64]]]
+        pacific = [[[-170, -10], [-160, -10], [-160, 0], [-170, 0], [-170, -10]]]
+
+        query = {"geometry": {"type": "Polygon", "coordinates": alaska}}
+        response = test_client.post("/bertron/geo/within", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        entities_data = response.json()
+        assert entities_data["count"] > 0
+        assert all(e["ber_data_source"] == "ESS-DIVE" for e in entities_data["documents"])
+
+        query = {"geometry": {"type": "MultiPolygon", "coordinates": [alaska, pacific]}}
+        response = test_client.post("/bertron/geo/within", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["count"] == entities_data["count"]
+
+        query = {"geometry": {"type": "Polygon", "coordinates": pacific}}
+        response = test_client.post("/bertron/geo/within", json=query)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["count"] == 0
+
     def test_geo_bounding_box_invalid_coordinates(
         self, test_client: TestClient, seeded_db: Database
     ):
@@ -292,6 +866,57 @@ class TestBertronAPI:
         error_data = response.json()
         assert "latitude" in error_data["detail"].lower()
 
+    def test_geo_clusters(self, test_client: TestClient, seeded_db: Database):
+        """Test grouping entities into clusters, whose size depends on the zoom level."""
+        num_located_entities = seeded_db.entities.count_documents(
+            {"geojson": {"$exists": True}}
+        )
+        params = {"bbox": "-180,-90,180,90", "zoom": 0}
+
+        response = test_client.get("/bertron/geo/clusters", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["total"] == num_located_entities
+        assert data["count"] == len(data["clusters"]) < num_located_entities
+        for cluster in data["clusters"]:
+            assert sum(cluster["ber_data_sources"].values()) == cluster["count"]
+            assert -90 <= cluster["latitude"] <= 90
+            assert -180 <= cluster["longitude"] <= 180
+
+        # At a high zoom level, each of these entities is in its own cluster.
+        params["zoom"] = 18
+        data = test_client.get("/bertron/geo/clusters", params=params).json()
+        assert data["total"] == num_located_entities
+        assert data["count"] > 3
+
+        params["bbox"] = "-120,50,-100,40"  # south > north
+        response = test_client.get("/bertron/geo/clusters", params=params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_geo_tile(self, test_client: TestClient, seeded_db: Database):
+        """Test getting a vector tile containing the entities' locations."""
+        entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"  # at (34, 118)
+
+        response = test_client.get("/bertron/geo/tiles/0/0/0.mvt")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+        assert entity_id.encode() in response.content
+        assert b"entities" in response.content  # the layer name
+
+        cached_response = test_client.get("/bertron/geo/tiles/0/0/0.mvt")
+        assert cached_response.headers["x-cache"] == "HIT"
+        assert cached_response.content == response.content
+
+        # Tiles only contain the entities located within them.
+        response = test_client.get("/bertron/geo/tiles/3/6/3.mvt")
+        assert entity_id.encode() in response.content
+        response = test_client.get("/bertron/geo/tiles/3/0/0.mvt")
+        assert response.status_code == status.HTTP_200_OK
+        assert entity_id.encode() not in response.content
+
+        response = test_client.get("/bertron/geo/tiles/3/8/0.mvt")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def _verify_entity_structure(self, entity: Dict[str, Any]):
         """Helper method to verify entity structure matches schema."""
         required_fields = [
@@ -1,9 +1,16 @@
+import gzip
 import json
 import os
+import sys
 
 import pytest
 from pymongo.database import Database
 
+from src.config import settings
+from src.ingest_data import BertronMongoDBIngestor, BulkEntityWriter, EntityValidator
+from src.ingest_data import main as ingest_main
+from lib.geohash import geohash_prefixes
+
 
 @pytest.fixture
 def sample_data_dir():
@@ -124,4 +131,241 @@ def test_data_source_diversity(seeded_db: Database):
     # Should have multiple data sources
     assert len(data_sources) >= 3
     expected_sources = {"EMSL", "ESS-DIVE", "NMDC", "JGI"}
-    assert set(data_sources).issubset(expected_sources)
\ No newline at end of file
+    assert set(data_sources).issubset(expected_sources)
+
+
+def test_pages_of_filtered_entities_read_via_index(seeded_db: Database):
+    """Test that a page of the entities from a data source, sorted by `id`, is read via an index."""
+    cursor = seeded_db.entities.find({"ber_data_source": "EMSL"}).sort("id").limit(1)
+    winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+
+    # Note: MongoDB nests the plan within `queryPlan` when it uses the slot-based engine.
+    plan = json.dumps(winning_plan.get("queryPlan", winning_plan))
+    assert "ber_data_source_1_id_1" in plan
+    assert '"SORT"' not in plan
+
+
+def test_ingest_generation_recorded(seeded_db: Database):
+    """Test that ingesting data records a new ingest generation."""
+    state = seeded_db.ingest_state.find_one({"_id": "entities"})
+    assert state is not None
+
+    # The seeded_db fixture ingested data into a new database once, which started one
+    # generation before it modified the data and another one afterward.
+    assert state["generation"] == 2
+
+    # The generation records when the most recently ingested entity was ingested.
+    latest_entity = seeded_db.entities.find_one(sort=[("_metadata.ingested_at", -1)])
+    assert latest_entity is not None
+    assert state["last_ingested_at"] == latest_entity["_metadata"]["ingested_at"]
+
+
+def test_ingest_generation_recorded_when_ingest_fails(seeded_db: Database, monkeypatch):
+    """Test that an ingest that fails partway through still records new ingest generations."""
+    ingest_cli_args = [
+        "ingest_data.py",
+        "--mongo-uri",
+        f"mongodb://{settings.mongo_username}:{settings.mongo_password}@{settings.mongo_host}:{settings.mongo_port}",
+        "--db-name",
+        settings.mongo_database,
+        "--input",
+        "tests/data",
+    ]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Simulated failure")
+
+    monkeypatch.setattr(BertronMongoDBIngestor, "ingest_file", fail)
+    monkeypatch.setattr(sys, "argv", ingest_cli_args)
+    with pytest.raises(RuntimeError):
+        ingest_main()
+
+    state = seeded_db.ingest_state.find_one({"_id": "entities"})
+    assert state["generation"] == 4
+
+
+def test_geohashes_stored_and_backfilled(seeded_db: Database):
+    """Test that the geohashes of entities' locations are stored, and can be backfilled."""
+    entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+    entity = seeded_db.entities.find_one({"id": entity_id})
+    assert entity is not None
+    assert entity["geohash"] == geohash_prefixes(118, 34)
+    assert seeded_db.entities.find_one({"geohash": "ww5c"})["id"] == entity_id
+
+    # Simulate an entity that was ingested before the ingest script stored geohashes.
+    seeded_db.entities.update_one({"id": entity_id}, {"$unset": {"geohash": ""}})
+    ingestor = BertronMongoDBIngestor(
+        mongo_uri="", db_name=seeded_db.name, schema_path=None
+    )
+    ingestor.db = seeded_db
+    assert ingestor.backfill_geohashes() == 1
+    entity = seeded_db.entities.find_one({"id": entity_id})
+    assert entity["geohash"] == geohash_prefixes(118, 34)
+
+
+def test_geohash_backfill_records_ingest_generation(seeded_db: Database, monkeypatch):
+    """Test that backfilling geohashes records new ingest generations, as ingesting does."""
+    entity_id = "EMSL:c9405190-e962-4ba5-93f0-e3ff499f4488"
+    seeded_db.entities.update_one({"id": entity_id}, {"$unset": {"geohash": ""}})
+    ingest_cli_args = [
+        "ingest_data.py",
+        "--mongo-uri",
+        f"mongodb://{settings.mongo_username}:{settings.mongo_password}@{settings.mongo_host}:{settings.mongo_port}",
+        "--db-name",
+        settings.mongo_database,
+        "--backfill-geohash",
+    ]
+    monkeypatch.setattr(sys, "argv", ingest_cli_args)
+    ingest_main()
+
+    entity = seeded_db.entities.find_one({"id": entity_id})
+    assert entity["geohash"] == geohash_prefixes(118, 34)
+    state = seeded_db.ingest_state.find_one({"_id": "entities"})
+    assert state["generation"] == 4
+
+
+def test_bulk_entity_writer(seeded_db: Database):
+    """Test that the bulk writer upserts entities in batches, and counts what it did."""
+    writer = BulkEntityWriter(seeded_db.entities, batch_size=2)
+    writer.add({"id": "nmdc:bsm-11-bsf8yq62", "name": "Renamed"})
+    writer.add({"id": "test:1", "name": "First"})
+    writer.add({"id": "test:1", "name": "Second"})  # the same `id` again
+    writer.flush()
+
+    assert writer.stats == {"inserted": 1, "updated": 2, "error": 0}
+    assert seeded_db.entities.find_one({"id": "nmdc:bsm-11-bsf8yq62"})["name"] == "Renamed"
+    assert seeded_db.entities.find_one({"id": "test:1"})["name"] == "Second"
+
+
+def test_parallel_validation(sample_data_dir):
+    """Test that validating entities in worker processes gets the same results, in order."""
+    with open(os.path.join(sample_data_dir, "ess-dive-example.json")) as f:
+        entities = json.load(f) + [{"name": "An entity lacking an ID"}]
+
+    ingestor = BertronMongoDBIngestor(mongo_uri="", db_name="", schema_path=None)
+    ingestor.schema = {"type": "object", "required": ["id"]}
+    serial_results = list(ingestor.validate_entities(entities))
+    ingestor.start_workers(2)
+    try:
+        parallel_results = list(ingestor.validate_entities(entities))
+    finally:
+        ingestor.close()
+
+    assert parallel_results == serial_results
+    assert [entity for entity, _ in parallel_results] == entities
+    errors = [error for _, error in parallel_results]
+    assert all(error is None for error in errors[:-1])
+    assert "'id' is a required property" in errors[-1]
+
+
+def test_entity_validator_modes(sample_data_dir):
+    """Test that each validation mode validates entities against the right thing(s)."""
+    with open(os.path.join(sample_data_dir, "emsl-example.json")) as f:
+        entity = json.load(f)
+    schema = {"type": "object", "required": ["id", "not_in_the_model"]}
+
+    # The entity is valid per the `Entity` model, but not per the schema.
+    assert EntityValidator(schema, "pydantic").error(entity) is None
+    assert "'not_in_the_model'" in EntityValidator(schema, "jsonschema").error(entity)
+    assert "'not_in_the_model'" in EntityValidator(schema, "both").error(entity)
+
+    # The entity is valid per the schema, but not per the `Entity` model.
+    entity = {"id": "a", "not_in_the_model": 1}
+    assert EntityValidator(schema, "jsonschema").error(entity) is None
+    assert EntityValidator(schema, "pydantic").error(entity) is not None
+    assert EntityValidator(schema, "both").error(entity) is not None
+
+    # Values that are not objects are invalid (rather than crashing the validator).
+    for mode in ("jsonschema", "pydantic", "both"):
+        for value in (None, 123, ["a"]):
+            assert EntityValidator(schema, mode).error(value) is not None
+
+    with pytest.raises(ValueError):
+        EntityValidator(schema, "neither")
+
+
+def test_ndjson_file_ingestion(seeded_db: Database, sample_data_dir, tmp_path):
+    """Test that NDJSON files, which contain one entity per line, are processed correctly."""
+    path = tmp_path / "entities.jsonl"
+    with open(path, "w") as f:
+        for filename in ("emsl-example.json", "nmdc-example.json"):
+            with open(os.path.join(sample_data_dir, filename)) as sample_file:
+                entity = json.load(sample_file)
+            f.write(json.dumps({**entity, "name": "From NDJSON"}) + "\n")
+
+    ingestor = BertronMongoDBIngestor(
+        mongo_uri="", db_name=seeded_db.name, schema_path=None
+    )
+    ingestor.db = seeded_db
+    ingestor.schema = {"type": "object", "required": ["id"]}
+    stats = ingestor.ingest_file(str(path))
+
+    assert stats["processed"] == stats["valid"] == stats["updated"] == 2
+    assert seeded_db.entities.count_documents({"name": "From NDJSON"}) == 2
+
+
+def test_malformed_file_ingestion_with_workers(
+    seeded_db: Database, sample_data_dir, tmp_path
+):
+    """Test that the entities before a malformed part of a file are ingested, when validating in workers."""
+    with open(os.path.join(sample_data_dir, "emsl-example.json")) as f:
+        entity = json.load(f)
+    entities = [{**entity, "id": f"malformed-file:{i}"} for i in range(150)]
+    path = tmp_path / "entities.json"
+    path.write_text(json.dumps(entities)[:-1] + ', {"id": }]')
+
+    ingestor = BertronMongoDBIngestor(
+        mongo_uri="", db_name=seeded_db.name, schema_path=None
+    )
+    ingestor.db = seeded_db
+    ingestor.schema = {"type": "object", "required": ["id"]}
+    ingestor.start_workers(2)
+    try:
+        stats = ingestor.ingest_file(str(path))
+    finally:
+        ingestor.close()
+
+    assert stats["processed"] == stats["valid"] == stats["inserted"] == 150
+    assert stats["error"] == 1
+    query = {"id": {"$regex": "^malformed-file:"}}
+    assert seeded_db.entities.count_documents(query) == 150
+
+
+def test_compressed_file_ingestion(seeded_db: Database, sample_data_dir, tmp_path):
+    """Test that compressed files are decompressed as they are ingested."""
+    path = tmp_path / "entities.json.gz"
+    with open(os.path.join(sample_data_dir, "gold-example.json")) as f:
+        entity = json.load(f)
+    with gzip.open(path, "wt") as f:
+        json.dump([{**entity, "name": "From gzip"}], f)
+
+    ingestor = BertronMongoDBIngestor(
+        mongo_uri="", db_name=seeded_db.name, schema_path=None
+    )
+    ingestor.db = seeded_db
+    ingestor.schema = {"type": "object", "required": ["id"]}
+    stats = ingestor.ingest_file(str(path))
+
+    assert stats["processed"] == stats["valid"] == stats["updated"] == 1
+    assert seeded_db.entities.find_one({"id": entity["id"]})["name"] == "From gzip"
+
+    # A corrupt file is reported as an error (rather than crashing the ingest script).
+    path.write_bytes(gzip.compress(b'[{"id": "a"}]')[:-8])
+    assert ingestor.ingest_file(str(path))["error"] == 1
+
+
+def test_zstd_file_ingestion_without_zstandard(seeded_db: Database, tmp_path, monkeypatch):
+    """Test that a .zst file is reported as an error when the `zstandard` package is missing."""
+    monkeypatch.setattr("lib.compression.zstandard", None)
+    path = tmp_path / "entities.json.zst"
+    path.write_bytes(b"")
+
+    ingestor = BertronMongoDBIngestor(
+        mongo_uri="", db_name=seeded_db.name, schema_path=None
+    )
+    ingestor.db = seeded_db
+    ingestor.schema = {"type": "object", "required": ["id"]}
+    stats = ingestor.ingest_file(str(path))
+
+    assert stats["processed"] == 0
+    assert stats["error"] == 1
@@ -15,8 +15,11 @@ from src.server import app
 
 @pytest.fixture
 def test_client():
-    test_client = TestClient(app)
-    yield test_client
+    # Note: We use the `TestClient` as a context manager so that the app's `lifespan`
+    #       handler runs (which is what connects the app to the database).
+    #       Reference: https://fastapi.tiangolo.com/advanced/testing-events/
+    with TestClient(app) as test_client:
+        yield test_client
 
 
 def test_root_endpoint_redirects_to_api_docs(test_client: TestClient):